@@ -0,0 +1 @@
+"""Offline benchmarks for the ICP Qualifier pipeline."""
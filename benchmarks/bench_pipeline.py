@@ -0,0 +1,386 @@
+"""
+Offline end-to-end benchmark for DashcamCompanyFinder.
+
+Runs find_companies() and setup_vector_database() at several scales against
+local stand-ins (fake Ollama server, fake search provider, static site corpus),
+reports throughput, latency percentiles, LLM calls per qualified company and
+peak memory, and compares the results with a stored baseline.
+
+Usage:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --scales 50 200 --llm-latency 0.05 --malformed-rate 0.1
+    python -m benchmarks.bench_pipeline --baseline latest --fail-on-regression
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict
+import psutil
+from benchmarks.fakes import (PROFILES, SiteCorpus, FakeSearchProvider, FakeOllamaServer,
+                              write_brochure_corpus)
+RESULTS_DIR = Path(__file__).parent / "results"
+# (metric, True if higher is worse) pairs checked against the baseline; dotted names index nested
+# dicts. Result counts (qualified companies, funnel, chunks) are correctness checks: fewer is a regression
+REGRESSION_METRICS = {
+    "pipeline": [("wall_seconds", True), ("items_per_second", False), ("item_latency_p95", True),
+                 ("llm_calls_per_qualified", True), ("peak_rss_mb", True), ("qualified", False),
+                 ("funnel.verified", False), ("funnel.heuristic", False), ("funnel.scored", False),
+                 ("funnel.qualified", False)],
+    "vector_db": [("build_seconds", True), ("load_seconds", True), ("retrieval_latency_p95", True),
+                  ("peak_rss_mb", True), ("chunks", False)],
+}
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)], 6)
+def bench_config(num_keywords: int, processing: Dict, vector_store: str = "chroma") -> Dict:
+    """config.yaml contents used for benchmark runs."""
+    return {
+        "llm": {"fast_model": "bench-fast", "creative_model": "bench-creative", "embedding_model": "bench-embed"},
+        "rag": {"chunk_size": 1000, "chunk_overlap": 200, "retrieval_top_k": 5, "force_rebuild": False,
+                "vector_store": vector_store},
+        "discovery": {
+            "sources": {"USA": ["bench.local"]},
+            "positive_keywords": [f"keyword{i}" for i in range(num_keywords)],
+            "heuristic_keywords": ["dashcam", "telematics", "fleet"],
+        },
+        "scoring": {"relevance_threshold": 7, "exemplar_companies": ["Samsara", "Lytx", "Nauto"]},
+        "revenue": {"minimum_threshold_millions": 15, "fallback_enabled": True,
+                    "financial_sources": ["finance.example"]},
+        "processing": processing,
+    }
+def fetch_text_http(url: str) -> str:
+    """Plain HTTP scraper for environments without a Playwright browser."""
+    import requests
+    from bs4 import BeautifulSoup
+    try:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        return BeautifulSoup(response.text, "lxml").get_text(" ", strip=True)
+    except Exception:
+        return ""
+@contextlib.contextmanager
+def patched(target, name: str, value):
+    """Temporarily replace a module attribute."""
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+@contextlib.contextmanager
+def bench_environment(workdir: Path, config: Dict, search=None, scraper: str = "crawl4ai", quiet: bool = True):
+    """Point the pipeline at the benchmark config, a scratch directory and the local stand-ins."""
+    import src.config as config_module
+    import src.advanced_dashcam_rag as rag_module
+    import src.dashcam_company_finder as finder_module
+    import src.utils as utils_module
+    saved_config = dict(config_module.CONFIG)
+    config_module.CONFIG.clear()
+    config_module.CONFIG.update(config)
+    output = io.StringIO() if quiet else None
+    try:
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(patched(rag_module, "DASHCAM_DATA_PATH", workdir / "Data"))
+            stack.enter_context(patched(rag_module, "DASHCAM_VECTOR_DB_PATH", workdir / "vector_db" / "dashcam_vectordb"))
+            stack.enter_context(patched(rag_module, "DASHCAM_FLAT_INDEX_PATH", workdir / "vector_db" / "dashcam_flat"))
+            stack.enter_context(patched(rag_module, "METADATA_FILE", workdir / "vector_db" / "metadata.json"))
+            stack.enter_context(patched(finder_module, "RESULTS_FILE", workdir / "results.json"))
+            stack.enter_context(patched(finder_module, "COMPANY_INDEX_PATH", workdir / "vector_db" / "company_index"))
+            if search is not None:
+                stack.enter_context(patched(finder_module, "perform_web_search", search))
+            if scraper == "http":
+                stack.enter_context(patched(utils_module, "_run_scraper", fetch_text_http))
+            if output is not None:
+                stack.enter_context(contextlib.redirect_stdout(output))
+            yield
+    finally:
+        config_module.CONFIG.clear()
+        config_module.CONFIG.update(saved_config)
+class RSSSampler:
+    """
+    Samples the process RSS (Python heap plus native memory, e.g. Chroma) in a background thread.
+
+    Unlike ru_maxrss, the peak is tracked per measured block, and unlike tracemalloc
+    it doesn't slow down the code being timed.
+    """
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+        self.start_rss = self.peak_rss = 0
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+    def __enter__(self):
+        self.start_rss = self.peak_rss = self._process.memory_info().rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+    def stats(self) -> Dict:
+        return {"peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+                "rss_growth_mb": round((self.peak_rss - self.start_rss) / 2 ** 20, 1)}
+def run_pipeline_benchmark(scale: int, ollama: FakeOllamaServer, args) -> Dict:
+    """Benchmark find_companies() on a corpus of `scale` search results."""
+    from src.dashcam_company_finder import DashcamCompanyFinder
+    from src.metrics import METRICS
+    item_latencies: List[float] = []
+    enrich_latencies: List[float] = []
+    class TimedFinder(DashcamCompanyFinder):
+        def _process_search_item(self, item, existing_company_names):
+            start = time.perf_counter()
+            try:
+                return super()._process_search_item(item, existing_company_names)
+            finally:
+                item_latencies.append(time.perf_counter() - start)
+        def _enrich_company(self, company):
+            start = time.perf_counter()
+            try:
+                return super()._enrich_company(company)
+            finally:
+                enrich_latencies.append(time.perf_counter() - start)
+    workdir = Path(tempfile.mkdtemp(prefix=f"icp_bench_{scale}_"))
+    corpus = SiteCorpus(scale, seed=args.seed, root=workdir / "sites").start()
+    search = FakeSearchProvider(corpus, latency=args.search_latency, failure_rate=args.search_failure_rate,
+                                seed=args.seed)
+    write_brochure_corpus(workdir / "Data", num_pages=10, seed=args.seed)
+    # Each discovery query returns 2 results; size the keyword list so the queries cover the corpus
+    num_keywords = max(1, math.ceil(scale / (2 * len(PROFILES))))
+    processing = {"max_parallel_searches": args.search_workers, "max_parallel_processing": args.process_workers,
+                  "max_parallel_enrichment": args.enrich_workers}
+    try:
+        with bench_environment(workdir, bench_config(num_keywords, processing), search=search,
+                               scraper=args.scraper, quiet=not args.verbose):
+            start = time.perf_counter()
+            finder = TimedFinder()
+            init_seconds = time.perf_counter() - start
+            METRICS.reset()
+            ollama.reset_counts()
+            with RSSSampler() as sampler:
+                start = time.perf_counter()
+                qualified = finder.find_companies("USA")
+                wall_seconds = time.perf_counter() - start
+            memory = sampler.stats()
+            report = METRICS.run_report()
+            dedup = finder.company_index.avoided_work_report()
+    finally:
+        corpus.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    llm_calls = ollama.generate_calls
+    return {
+        "scale": scale,
+        "init_seconds": round(init_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "items_processed": len(item_latencies),
+        "items_per_second": round(len(item_latencies) / wall_seconds, 2) if wall_seconds else None,
+        "qualified": len(qualified),
+        "item_latency_p50": percentile(item_latencies, 50),
+        "item_latency_p95": percentile(item_latencies, 95),
+        "item_latency_p99": percentile(item_latencies, 99),
+        "enrich_latency_p50": percentile(enrich_latencies, 50),
+        "enrich_latency_p95": percentile(enrich_latencies, 95),
+        "llm_calls": llm_calls,
+        "llm_calls_by_model": {key.split(":", 1)[1]: n for key, n in ollama.counts.items() if key.startswith("generate:")},
+        "llm_calls_per_qualified": round(llm_calls / len(qualified), 2) if qualified else None,
+        "search_calls": search.calls,
+        "funnel": report["funnel"],
+        "retries": report["retries"],
+        "dedup": dedup,
+        **memory,
+    }
+def run_vector_db_benchmark(num_pages: int, ollama: FakeOllamaServer, args) -> Dict:
+    """Benchmark building, loading and querying the RAG vector database for `num_pages` brochure pages."""
+    from src.advanced_dashcam_rag import AdvancedDashcamRAG
+    queries = ["Which fleets need driver monitoring?", "What ADAS features are offered?",
+               "How does the dashcam upload video?", "Who buys collision avoidance systems?"]
+    workdir = Path(tempfile.mkdtemp(prefix=f"icp_bench_rag_{num_pages}_"))
+    write_brochure_corpus(workdir / "Data", num_pages=num_pages, seed=args.seed)
+    try:
+        with bench_environment(workdir, bench_config(1, {}, args.vector_store), quiet=not args.verbose):
+            ollama.reset_counts()
+            with RSSSampler() as sampler:
+                start = time.perf_counter()
+                AdvancedDashcamRAG().setup_vector_database(force=True)
+                build_seconds = time.perf_counter() - start
+                embed_calls = ollama.counts.get("embed", 0)
+                start = time.perf_counter()
+                rag = AdvancedDashcamRAG()
+                rag.setup_vector_database(force=False)
+                load_seconds = time.perf_counter() - start
+                retrieval_latencies = []
+                query_latencies = []
+                for i in range(args.queries):
+                    question = queries[i % len(queries)]
+                    start = time.perf_counter()
+                    rag.vector_db.similarity_search(question, k=5)
+                    retrieval_latencies.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    rag.query_knowledge(question)
+                    query_latencies.append(time.perf_counter() - start)
+            num_chunks = len(rag.vector_db.get()["ids"]) if hasattr(rag.vector_db, "get") else len(rag.vector_db)
+            memory = sampler.stats()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "pages": num_pages,
+        "chunks": num_chunks,
+        "build_seconds": round(build_seconds, 3),
+        "embed_calls": embed_calls,
+        "load_seconds": round(load_seconds, 3),
+        "retrieval_latency_p50": percentile(retrieval_latencies, 50),
+        "retrieval_latency_p95": percentile(retrieval_latencies, 95),
+        "query_latency_p50": percentile(query_latencies, 50),
+        "query_latency_p95": percentile(query_latencies, 95),
+        **memory,
+    }
+def find_baseline(spec: Optional[str]) -> Optional[Path]:
+    """Resolve --baseline: a file path, or 'latest' for the newest stored result."""
+    if not spec:
+        return None
+    if spec != "latest":
+        return Path(spec)
+    stored = sorted(RESULTS_DIR.glob("bench_*.json"))
+    return stored[-1] if stored else None
+def metric_value(row: Dict, metric: str):
+    """Look up a possibly dotted metric name ("funnel.qualified") in a result row."""
+    value = row
+    for part in metric.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return a description of every metric that got worse by more than `tolerance` (relative)."""
+    regressions = []
+    for section, metrics in REGRESSION_METRICS.items():
+        key = "scale" if section == "pipeline" else "pages"
+        baseline_rows = {row[key]: row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            old = baseline_rows.get(row[key])
+            if not old:
+                continue
+            for metric, higher_is_worse in metrics:
+                new_value, old_value = metric_value(row, metric), metric_value(old, metric)
+                if old_value is None:
+                    continue
+                if new_value is None:
+                    # e.g. llm_calls_per_qualified once nothing qualifies any more
+                    regressions.append(f"{section}[{key}={row[key]}] {metric}: {old_value} -> missing")
+                    continue
+                if old_value == 0:
+                    if higher_is_worse and new_value > 0:
+                        regressions.append(f"{section}[{key}={row[key]}] {metric}: 0 -> {new_value}")
+                    continue
+                change = (new_value - old_value) / old_value
+                if (change if higher_is_worse else -change) > tolerance:
+                    regressions.append(f"{section}[{key}={row[key]}] {metric}: {old_value} -> {new_value} "
+                                       f"({change:+.0%})")
+    return regressions
+def print_table(title: str, rows: List[Dict], columns: List[str]):
+    print(f"\n--- {title} ---")
+    print(" ".join(f"{column:>{len(column)}}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column)
+            cells.append(f"{value:>{len(column)}.4f}" if isinstance(value, float) else f"{str(value):>{len(column)}}")
+        print(" ".join(cells))
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the company finder pipeline.")
+    parser.add_argument("--scales", type=int, nargs='+', default=[20, 100, 300],
+                       help="Search result counts for the find_companies benchmark.")
+    parser.add_argument("--rag-pages", type=int, nargs='+', default=[10, 50, 200],
+                       help="Brochure page counts for the setup_vector_database benchmark.")
+    parser.add_argument("--skip-pipeline", action="store_true", help="Skip the find_companies benchmark.")
+    parser.add_argument("--skip-rag", action="store_true", help="Skip the vector database benchmark.")
+    parser.add_argument("--vector-store", choices=["chroma", "flat"], default="chroma",
+                        help="rag.vector_store backend for the vector database benchmark.")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Fake Ollama generate latency (seconds).")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Fake Ollama latency per embedded text.")
+    parser.add_argument("--malformed-rate", type=float, default=0.05,
+                       help="Share of LLM answers that are not valid JSON (exercises retries).")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Fake search latency (seconds).")
+    parser.add_argument("--search-failure-rate", type=float, default=0.0, help="Share of searches returning nothing.")
+    parser.add_argument("--scraper", choices=["crawl4ai", "http"], default="crawl4ai",
+                       help="'crawl4ai' scrapes the local corpus with the real scraper; 'http' uses plain requests.")
+    parser.add_argument("--search-workers", type=int, default=15)
+    parser.add_argument("--process-workers", type=int, default=10)
+    parser.add_argument("--enrich-workers", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20, help="Queries per vector database scale.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=str, default=None,
+                       help="Result file to compare against, or 'latest' for the newest stored run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions.")
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output.")
+    args = parser.parse_args()
+    baseline_path = find_baseline(args.baseline)
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    ollama = FakeOllamaServer(latency=args.llm_latency, embedding_latency=args.embedding_latency,
+                              malformed_rate=args.malformed_rate, seed=args.seed).start()
+    # The Ollama client reads OLLAMA_HOST when the models are created
+    os.environ["OLLAMA_HOST"] = ollama.url
+    results = {"created_at": datetime.now().isoformat(), "git_commit": git_commit(), "settings": vars(args),
+               "pipeline": [], "vector_db": []}
+    try:
+        if not args.skip_pipeline:
+            for scale in args.scales:
+                print(f"⏱️ find_companies at scale {scale}...")
+                results["pipeline"].append(run_pipeline_benchmark(scale, ollama, args))
+        if not args.skip_rag:
+            for num_pages in args.rag_pages:
+                print(f"⏱️ setup_vector_database with {num_pages} pages...")
+                results["vector_db"].append(run_vector_db_benchmark(num_pages, ollama, args))
+    finally:
+        ollama.stop()
+    if results["pipeline"]:
+        print_table("find_companies", results["pipeline"],
+                    ["scale", "wall_seconds", "items_per_second", "item_latency_p50", "item_latency_p95",
+                     "qualified", "llm_calls_per_qualified", "peak_rss_mb", "rss_growth_mb"])
+    if results["vector_db"]:
+        print_table("setup_vector_database", results["vector_db"],
+                    ["pages", "chunks", "build_seconds", "load_seconds", "retrieval_latency_p50",
+                     "retrieval_latency_p95", "query_latency_p50", "peak_rss_mb", "rss_growth_mb"])
+    if not args.no_save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output_path = RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\n💾 Results saved to {output_path}")
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print(f"\n--- Comparison with {baseline_path} (tolerance {args.tolerance:.0%}) ---")
+        for regression in regressions:
+            print(f" ⚠️ REGRESSION {regression}")
+        if not regressions:
+            print(" ✅ No regressions.")
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+    elif args.baseline:
+        print("\n⚠️ No baseline found to compare against.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Chroma vs FlatVectorStore benchmark for the RAG knowledge base.
+
+Builds both stores from the same synthetic brochure chunks (in-process hash
+embeddings, so no Ollama is needed) and reports build time, cold load time
+(store construction plus the first query), single-query latency percentiles,
+batched query throughput, on-disk size and Chroma's recall against exact search.
+
+Usage:
+    python -m benchmarks.bench_vector_store
+    python -m benchmarks.bench_vector_store --chunks 500 5000 20000 --dim 768 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from benchmarks.fakes import hash_embedding
+from benchmarks.bench_pipeline import RESULTS_DIR, percentile, print_table
+VOCABULARY = ["dashcam", "fleet", "driver", "monitoring", "adas", "collision", "warning", "lane", "telematics",
+              "video", "upload", "lte", "cloud", "storage", "night", "vision", "sensor", "camera", "safety",
+              "insurance", "claims", "coaching", "fatigue", "distraction", "gps", "tracking", "route",
+              "trucking", "logistics", "bus", "school", "delivery", "van", "event", "g-sensor", "parking",
+              "mode", "resolution", "1080p", "4k", "wide", "angle", "lens", "api", "integration", "dashboard"]
+QUESTIONS = ["Which fleets need driver monitoring?", "What ADAS features are offered?",
+             "How does the dashcam upload video?", "Who buys collision avoidance systems?",
+             "Does the camera support night vision?", "How are insurance claims handled?"]
+class HashEmbeddings(Embeddings):
+    """Deterministic in-process embeddings so only the vector store is measured."""
+    def __init__(self, dim: int):
+        self.dim = dim
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [hash_embedding(text, self.dim) for text in texts]
+    def embed_query(self, text: str) -> List[float]:
+        return hash_embedding(text, self.dim)
+def make_chunks(num_chunks: int, seed: int) -> List[str]:
+    """Synthetic brochure chunks of about 150 words each."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(150)) for _ in range(num_chunks)]
+def directory_mb(path: Path) -> float:
+    return round(sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1e6, 2)
+def build_store(backend: str, texts: List[str], embeddings: Embeddings, path: Path):
+    from langchain_chroma import Chroma
+    from src.flat_vector_store import FlatVectorStore
+    if backend == "flat":
+        return FlatVectorStore.from_texts(texts, embeddings, persist_directory=str(path))
+    return Chroma.from_texts(texts, embeddings, persist_directory=str(path))
+def load_store(backend: str, embeddings: Embeddings, path: Path):
+    from langchain_chroma import Chroma
+    from src.flat_vector_store import FlatVectorStore
+    if backend == "flat":
+        return FlatVectorStore(embedding=embeddings, persist_directory=str(path))
+    # Drop the cached client so Chroma really reopens the database from disk
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+    return Chroma(persist_directory=str(path), embedding_function=embeddings)
+def query_batch(store, queries: List[str], k: int):
+    """One batched call where the store supports it, otherwise one search per query."""
+    if hasattr(store, "similarity_search_batch"):
+        return store.similarity_search_batch(queries, k=k)
+    return [store.similarity_search(query, k=k) for query in queries]
+def run_backend(backend: str, texts: List[str], query_vectors: List[List[float]], args) -> Dict:
+    """Build, reload and query one backend; returns its metrics and the ids returned per query."""
+    embeddings = HashEmbeddings(args.dim)
+    workdir = Path(tempfile.mkdtemp(prefix=f"icp_bench_{backend}_"))
+    try:
+        # Warm-up build so one-time startup (chromadb client and system init, imports) isn't timed
+        build_store(backend, texts[:50], embeddings, workdir / "warmup")
+        start = time.perf_counter()
+        build_store(backend, texts, embeddings, workdir / "store")
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        store = load_store(backend, embeddings, workdir / "store")
+        store.similarity_search_by_vector(query_vectors[0], k=args.k)
+        cold_seconds = time.perf_counter() - start
+        latencies, returned = [], []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            documents = store.similarity_search_by_vector(vector, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            returned.append([doc.page_content for doc in documents])
+        batch = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.batch_size)]
+        start = time.perf_counter()
+        query_batch(store, batch, args.k)
+        batch_seconds = time.perf_counter() - start
+        size_mb = directory_mb(workdir / "store")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "backend": backend,
+        "chunks": len(texts),
+        "build_seconds": round(build_seconds, 3),
+        "cold_load_seconds": round(cold_seconds, 4),
+        "query_latency_p50": percentile(latencies, 50),
+        "query_latency_p95": percentile(latencies, 95),
+        "batch_queries_per_second": round(args.batch_size / batch_seconds, 1) if batch_seconds else None,
+        "disk_mb": size_mb,
+        "_returned": returned,
+    }
+def recall(returned: List[List[str]], exact: List[List[str]]) -> float:
+    """Share of the exact top-k results found by an approximate search."""
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(returned, exact))
+    total = sum(len(expected) for expected in exact)
+    return round(hits / total, 4) if total else 1.0
+def main():
+    parser = argparse.ArgumentParser(description="Compare Chroma and the flat vector store.")
+    parser.add_argument("--chunks", type=int, nargs='+', default=[500, 5000, 20000], help="Corpus sizes (chunks).")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (nomic-embed-text uses 768).")
+    parser.add_argument("--queries", type=int, default=100, help="Single queries per corpus size.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries in the batched comparison.")
+    parser.add_argument("-k", type=int, default=5, help="Results per query (rag.retrieval_top_k).")
+    parser.add_argument("--backends", nargs='+', choices=["chroma", "flat"], default=["chroma", "flat"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results.")
+    args = parser.parse_args()
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    rows = []
+    for num_chunks in args.chunks:
+        texts = make_chunks(num_chunks, args.seed)
+        rng = random.Random(args.seed + num_chunks)
+        query_vectors = [hash_embedding(" ".join(rng.choice(VOCABULARY) for _ in range(12)), args.dim)
+                         for _ in range(args.queries)]
+        # Exact top-k per query, to measure how much the ANN index gives up
+        matrix = np.asarray([hash_embedding(text, args.dim) for text in texts], dtype=np.float32)
+        scores = np.asarray(query_vectors, dtype=np.float32) @ matrix.T
+        exact = [[texts[i] for i in np.argsort(-row)[:args.k]] for row in scores]
+        for backend in args.backends:
+            print(f"⏱️ {backend} with {num_chunks} chunks...")
+            row = run_backend(backend, texts, query_vectors, args)
+            row["recall_at_k"] = recall(row.pop("_returned"), exact)
+            rows.append(row)
+    print_table("vector store", rows, ["backend", "chunks", "build_seconds", "cold_load_seconds",
+                                       "query_latency_p50", "query_latency_p95", "batch_queries_per_second",
+                                       "disk_mb", "recall_at_k"])
+    if not args.no_save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output_path = RESULTS_DIR / f"vector_store_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output_path, "w") as f:
+            json.dump({"created_at": datetime.now().isoformat(), "settings": vars(args), "results": rows},
+                      f, indent=4)
+        print(f"\n💾 Results saved to {output_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Local stand-ins for the external services used by the pipeline:
+a fake Ollama HTTP server, a fake search provider and a static website corpus.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler, SimpleHTTPRequestHandler
+from pathlib import Path
+from typing import Optional, List, Dict
+PROFILES = [
+    "fleet management solution providers",
+    "commercial trucking telematics vendors",
+    "automotive electronics distributors",
+    "ride-hailing safety platforms",
+    "public transportation operators",
+]
+RELEVANT_COPY = (
+    "We build fleet safety systems: AI dashcam hardware, video telematics, "
+    "driver monitoring (DMS) with drowsiness and distraction detection, and ADAS "
+    "features such as lane departure and collision avoidance warnings."
+)
+IRRELEVANT_COPY = (
+    "We are a boutique bakery offering artisan sourdough, pastries and wedding cakes. "
+    "Visit our shop for seasonal specials and catering packages."
+)
+class SiteCorpus:
+    """
+    Deterministic corpus of fake companies, written as static HTML sites and served locally.
+
+    Each company is either relevant (passes the heuristic filter and scores high) or not,
+    and has its revenue listed on a financial site, on its own website, or nowhere.
+    A fraction of search results are blog posts that should be rejected as non-companies,
+    and a fraction are aliases ("X Inc.") of an earlier company that dedup should catch.
+    """
+    def __init__(self, size: int, seed: int = 42, relevant_fraction: float = 0.6,
+                 blog_fraction: float = 0.1, alias_fraction: float = 0.1, root: Optional[Path] = None):
+        rng = random.Random(seed)
+        self.root = Path(root or tempfile.mkdtemp(prefix="icp_bench_sites_"))
+        self.entries: List[Dict] = []
+        for i in range(size):
+            is_blog = rng.random() < blog_fraction
+            revenue_source = rng.choice(["financial", "website", None])
+            self.entries.append({
+                "slug": f"site{i:05d}",
+                "name": f"{'Blog' if is_blog else 'Company'} {i:05d} {rng.choice(['Systems', 'Telematics', 'Fleet'])}",
+                "is_blog": is_blog,
+                "relevant": rng.random() < relevant_fraction,
+                "revenue_m": round(rng.uniform(5, 120), 1),
+                "revenue_source": revenue_source,
+            })
+            companies = [entry for entry in self.entries[:-1] if not entry["is_blog"]]
+            if not is_blog and companies and rng.random() < alias_fraction:
+                original = rng.choice(companies)
+                self.entries[-1].update({key: original[key] for key in ("relevant", "revenue_m", "revenue_source")},
+                                        name=f"{original['name']} Inc.")
+        self.by_name = {entry["name"]: entry for entry in self.entries}
+        self._write_sites()
+        self._server = None
+        self.base_url = ""
+    def _write_sites(self):
+        for entry in self.entries:
+            body = RELEVANT_COPY if entry["relevant"] else IRRELEVANT_COPY
+            if entry["revenue_source"] == "website":
+                body += f" Our team of 400 people generated annual revenue of ${entry['revenue_m']}M last year."
+            # Pad pages to a realistic size so scraping and prompts carry real payloads
+            filler = " ".join(f"<p>{body}</p>" for _ in range(20))
+            page = f"<html><head><title>{entry['name']}</title></head><body><h1>{entry['name']}</h1>{filler}</body></html>"
+            site_dir = self.root / entry["slug"]
+            site_dir.mkdir(parents=True, exist_ok=True)
+            (site_dir / "index.html").write_text(page)
+    def start(self):
+        """Serve the corpus on a free localhost port."""
+        handler = partial(_QuietStaticHandler, directory=str(self.root))
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+    def url(self, entry: Dict) -> str:
+        return f"{self.base_url}/{entry['slug']}/"
+class _QuietStaticHandler(SimpleHTTPRequestHandler):
+    # Nagle + delayed ACK would add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+    def log_message(self, format, *args):
+        pass
+class _KeyedDraws:
+    """
+    Reproducible random draws keyed by request content.
+
+    The n-th draw for a key depends only on (seed, key, n), not on the order in
+    which concurrent threads arrive, so runs with the same seed behave the same.
+    """
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = {}
+    def random(self, key: str) -> float:
+        with self._lock:
+            n = self._calls[key] = self._calls.get(key, 0) + 1
+        digest = hashlib.md5(f"{self.seed}:{n}:{key}".encode()).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+    def reset(self):
+        with self._lock:
+            self._calls = {}
+class FakeSearchProvider:
+    """
+    Drop-in replacement for perform_web_search backed by a SiteCorpus.
+
+    Discovery queries hand out corpus entries in order, so a run covers every
+    entry once; revenue queries return a snippet only for companies whose
+    revenue is listed on a financial site.
+    """
+    def __init__(self, corpus: SiteCorpus, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 42):
+        self.corpus = corpus
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._draws = _KeyedDraws(seed)
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._assigned: Dict[str, List[Dict]] = {}
+        self.calls = 0
+    def __call__(self, query: str, num_results: int = 5, retries: int = 3) -> list[dict]:
+        with self._lock:
+            self.calls += 1
+        failed = self.failure_rate > 0 and self._draws.random(query) < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return []
+        if "annual revenue" in query:
+            match = re.search(r'"(.+?)"', query)
+            entry = self.corpus.by_name.get(match.group(1)) if match else None
+            if not entry or entry["revenue_source"] != "financial":
+                return []
+            return [{"title": f"{entry['name']} financials", "link": f"https://finance.example/{entry['slug']}",
+                     "snippet": f"{entry['name']} reported annual revenue of ${entry['revenue_m']}M."}]
+        with self._lock:
+            if query not in self._assigned:
+                self._assigned[query] = self.corpus.entries[self._cursor:self._cursor + num_results]
+                self._cursor += len(self._assigned[query])
+            entries = self._assigned[query]
+        return [{"title": f"{entry['name']} - {'Industry blog post' if entry['is_blog'] else 'Fleet video solutions'}",
+                 "link": self.corpus.url(entry),
+                 "snippet": f"{entry['name']} official website."}
+                for entry in entries]
+class FakeOllamaServer:
+    """
+    Minimal Ollama-compatible HTTP server (/api/generate, /api/embed, /api/embeddings, /api/tags).
+
+    Responses are canned per prompt type so the pipeline behaves like it would
+    against a real model. Latency and the share of malformed (non-JSON) answers
+    are configurable to exercise timing and the retry paths.
+    """
+    def __init__(self, latency: float = 0.0, embedding_latency: float = 0.0, malformed_rate: float = 0.0,
+                 embedding_dim: int = 64, seed: int = 42):
+        self.latency = latency
+        self.embedding_latency = embedding_latency
+        self.malformed_rate = malformed_rate
+        self.embedding_dim = embedding_dim
+        self._draws = _KeyedDraws(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._server = None
+        self.url = ""
+    def start(self):
+        """Serve on a free localhost port; point OLLAMA_HOST at self.url to use it."""
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Without this, Nagle + delayed ACK add ~40 ms to every call and mask the configured latency
+            disable_nagle_algorithm = True
+            def log_message(self, format, *args):
+                pass
+            def do_GET(self):
+                self._send_json({"models": [{"name": "fake:latest", "model": "fake:latest"}]})
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/generate":
+                    text = server.generate(body.get("model", ""), body.get("prompt", ""))
+                    if body.get("stream", True):
+                        self._send_stream(body.get("model", ""), text)
+                    else:
+                        self._send_json({"model": body.get("model"), "response": text, "done": True,
+                                         "done_reason": "stop"})
+                elif self.path == "/api/embed":
+                    inputs = body.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self._send_json({"model": body.get("model"), "embeddings": server.embed(inputs)})
+                elif self.path == "/api/embeddings":
+                    self._send_json({"embedding": server.embed([body.get("prompt", "")])[0]})
+                else:
+                    self.send_error(404)
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def _send_stream(self, model, text):
+                lines = [{"model": model, "response": text, "done": False},
+                         {"model": model, "response": "", "done": True, "done_reason": "stop"}]
+                data = b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {}
+        self._draws.reset()
+    @property
+    def generate_calls(self) -> int:
+        return sum(n for key, n in self.counts.items() if key.startswith("generate:"))
+    def generate(self, model: str, prompt: str) -> str:
+        self._count(f"generate:{model}")
+        if self.latency:
+            time.sleep(self.latency)
+        # Keyed by prompt (and how often it was sent) so the same answers are malformed in every run
+        malformed = self.malformed_rate > 0 and self._draws.random(f"{model}:{prompt}") < self.malformed_rate
+        if malformed:
+            return "Sure! Based on the text, the answer is probably yes, but I cannot format it."
+        if '"is_company"' in prompt:
+            title = re.search(r"Title: (.*)", prompt)
+            title = title.group(1) if title else ""
+            if "blog post" in title.lower():
+                return '{"is_company": false, "company_name": null}'
+            return json.dumps({"is_company": True, "company_name": title.split(" - ")[0].strip()})
+        if "relevance_score" in prompt:
+            score = 8 if "fleet safety" in prompt else 2
+            return f"{{'relevance_score': {score}, 'reasoning': 'Benchmark canned answer.'}}"
+        if "revenue_in_millions" in prompt:
+            text = prompt.split("Based *only* on the text provided")[0]
+            match = re.search(r"revenue of \$([\d.]+)M", text)
+            if not match:
+                return "null"
+            return json.dumps({"revenue_in_millions": float(match.group(1)), "confidence": "high",
+                               "reasoning": "Stated on the page."})
+        if "company profiles" in prompt:
+            return json.dumps(PROFILES)
+        return "I don't know based on the provided context."
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self._count("embed")
+        if self.embedding_latency:
+            time.sleep(self.embedding_latency * max(1, len(texts)))
+        return [hash_embedding(text, self.embedding_dim) for text in texts]
+def hash_embedding(text: str, dim: int = 64) -> List[float]:
+    """Deterministic bag-of-words embedding: similar texts get similar vectors."""
+    vector = [0.0] * dim
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.md5(token.encode()).digest()
+        vector[digest[0] % dim] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+def write_text_pdf(path: Path, pages: List[List[str]]):
+    """Write a minimal multi-page PDF with one Helvetica text line per list entry."""
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 750 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    Path(path).write_bytes(output)
+def write_brochure_corpus(directory: Path, num_pages: int, seed: int = 42):
+    """Write synthetic product brochures (about 40 lines per page) as PDFs into directory."""
+    rng = random.Random(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    words = ("dashcam fleet telematics driver monitoring ADAS collision lane departure camera video "
+             "cloud analytics distraction drowsiness trucking logistics insurance safety coaching").split()
+    pages = [[" ".join(rng.choice(words) for _ in range(12)) for _ in range(40)] for _ in range(num_pages)]
+    pages_per_pdf = 10
+    for i in range(0, num_pages, pages_per_pdf):
+        write_text_pdf(directory / f"brochure_{i // pages_per_pdf:03d}.pdf", pages[i:i + pages_per_pdf])
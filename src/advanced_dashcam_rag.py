@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 import time
 from datetime import datetime
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -8,16 +9,60 @@ from langchain.chains import RetrievalQA
 from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings, OllamaLLM as Ollama
 from langchain_community.document_loaders import PyPDFLoader
-from src.config import DASHCAM_DATA_PATH, DASHCAM_VECTOR_DB_PATH, METADATA_FILE, CONFIG
+from langchain_core.callbacks import BaseCallbackHandler
+from src.config import DASHCAM_DATA_PATH, DASHCAM_VECTOR_DB_PATH, DASHCAM_FLAT_INDEX_PATH, METADATA_FILE, CONFIG
+from src.flat_vector_store import FlatVectorStore
 from src.utils import parse_json_from_llm_response
+from src.metrics import METRICS
+class _LLMCallMetrics(BaseCallbackHandler):
+    """Records every call made by one LLM (latency, full prompt and response sizes) in METRICS."""
+    def __init__(self, model: str):
+        self.model = model
+        self._lock = threading.Lock()
+        self._running = {}
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._running[run_id] = (time.perf_counter(), sum(len(prompt) for prompt in prompts))
+    def _finish(self, run_id, response_chars: int, success: bool):
+        with self._lock:
+            started = self._running.pop(run_id, None)
+        if started:
+            start, prompt_chars = started
+            METRICS.record_llm_call(self.model, time.perf_counter() - start, prompt_chars, response_chars,
+                                    success=success)
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, sum(len(g.text) for gens in response.generations for g in gens), True)
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, 0, False)
+class _RetrievalMetrics(BaseCallbackHandler):
+    """Records vector store retrieval time as its own stage in METRICS."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = {}
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        with self._lock:
+            self._running[run_id] = time.perf_counter()
+    def _finish(self, run_id):
+        with self._lock:
+            start = self._running.pop(run_id, None)
+        if start is not None:
+            METRICS.observe("icp_stage_seconds", time.perf_counter() - start, stage="retrieval")
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id)
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
 class AdvancedDashcamRAG:
     def __init__(self):
         print("🚀 Initializing AdvancedDashcamRAG with local models...")
        
         # Load LLM configuration
         llm_config = CONFIG.get('llm', {})
-        self.llm_fast = Ollama(model=llm_config.get('fast_model', 'llama3:latest'))
-        self.llm_creative = Ollama(model=llm_config.get('creative_model', 'deepseek-llm:7b'))
+        # The callbacks record each actual LLM call (also those made inside the QA chain)
+        fast_model = llm_config.get('fast_model', 'llama3:latest')
+        creative_model = llm_config.get('creative_model', 'deepseek-llm:7b')
+        self.llm_fast = Ollama(model=fast_model, callbacks=[_LLMCallMetrics(fast_model)])
+        self.llm_creative = Ollama(model=creative_model, callbacks=[_LLMCallMetrics(creative_model)])
+        self.retrieval_metrics = _RetrievalMetrics()
        
         # Load embedding model
         self.embeddings = OllamaEmbeddings(model=llm_config.get('embedding_model', 'llama3'))
@@ -41,19 +86,31 @@ class AdvancedDashcamRAG:
         """
         if force is None:
             force = CONFIG.get('rag', {}).get('force_rebuild', False)
+        start = time.perf_counter()
+       
+        # "chroma" (default) or "flat" (memory-mapped NumPy matrix, faster to load and query for small corpora)
+        vector_store = CONFIG.get('rag', {}).get('vector_store', 'chroma')
+        persist_path = DASHCAM_FLAT_INDEX_PATH if vector_store == 'flat' else DASHCAM_VECTOR_DB_PATH
        
-        print("🗂️ Setting up vector database...")
-        if not force and DASHCAM_VECTOR_DB_PATH.exists() and METADATA_FILE.exists():
+        print(f"🗂️ Setting up vector database ({vector_store})...")
+        if not force and persist_path.exists() and METADATA_FILE.exists():
             print("✅ Vector database already exists. Loading...")
-            self.vector_db = Chroma(
-                persist_directory=str(DASHCAM_VECTOR_DB_PATH),
-                embedding_function=self.embeddings
-            )
+            if vector_store == 'flat':
+                self.vector_db = FlatVectorStore(
+                    embedding=self.embeddings,
+                    persist_directory=str(persist_path)
+                )
+            else:
+                self.vector_db = Chroma(
+                    persist_directory=str(persist_path),
+                    embedding_function=self.embeddings
+                )
         else:
             print("🔨 No existing database or force=True. Building new database...")
             pdf_files = list(DASHCAM_DATA_PATH.glob("*.pdf"))
             if not pdf_files:
                 print("⚠️ No PDF files found in the Data directory.")
+                METRICS.observe("icp_stage_seconds", time.perf_counter() - start, stage="vector_db_setup")
                 return
            
             documents = [doc for pdf_path in pdf_files for doc in PyPDFLoader(str(pdf_path)).load()]
@@ -61,21 +118,24 @@ class AdvancedDashcamRAG:
             texts = self.text_splitter.split_documents(documents)
            
             print("💾 Creating and persisting vector database...")
-            self.vector_db = Chroma.from_documents(
+            vector_store_class = FlatVectorStore if vector_store == 'flat' else Chroma
+            self.vector_db = vector_store_class.from_documents(
                 documents=texts,
                 embedding=self.embeddings,
-                persist_directory=str(DASHCAM_VECTOR_DB_PATH)
+                persist_directory=str(persist_path)
             )
            
             metadata = {
                 "last_updated": datetime.utcnow().isoformat(),
-                "ingested_files": [p.name for p in pdf_files]
+                "ingested_files": [p.name for p in pdf_files],
+                "vector_store": vector_store
             }
             with open(METADATA_FILE, "w") as f:
                 json.dump(metadata, f)
             print("✅ New vector database created and metadata saved.")
        
         self._setup_qa_chain()
+        METRICS.observe("icp_stage_seconds", time.perf_counter() - start, stage="vector_db_setup")
     def _setup_qa_chain(self):
         """Set up the QA chain for knowledge retrieval."""
         if self.vector_db:
@@ -116,9 +176,10 @@ class AdvancedDashcamRAG:
             print("⚠️ QA chain not set up.")
             return {"answer": "", "sources": []}
         try:
-            result = self.qa_chain.invoke({"query": question})
+            result = self.qa_chain.invoke({"query": question}, config={"callbacks": [self.retrieval_metrics]})
+            answer = result.get("result", "").strip()
             return {
-                "answer": result.get("result", "").strip(),
+                "answer": answer,
                 "sources": result.get("source_documents", [])
             }
         except Exception as e:
@@ -157,6 +218,7 @@ class AdvancedDashcamRAG:
                 print(f" ✅ Customer profiles: {profiles}")
                 return profiles
             print(" ⚠️ Attempt failed. Retrying...")
+            METRICS.increment("icp_retries_total", operation="generate_profiles")
             time.sleep(2)
         print(" ❌ Customer profiles: []")
         return []
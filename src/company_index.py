@@ -0,0 +1,311 @@
+import ipaddress
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable
+from urllib.parse import urlparse
+import numpy as np
+from src.metrics import METRICS
+# Trailing tokens that don't change a company's identity ("Samsara Inc." == "Samsara")
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "co", "company",
+    "gmbh", "ag", "sa", "sas", "srl", "bv", "nv", "plc", "pty", "pte", "oy", "ab", "spa",
+    "kk", "lp", "llp", "group", "holding", "holdings",
+}
+# Second-level labels under which companies register their domain (example.co.uk)
+SECOND_LEVEL_SUFFIXES = {"co", "com", "net", "org", "ac", "gov", "ltd", "plc"}
+# Hosting platforms that give every site its own subdomain: "acme.github.io" is the site, "github.io" is not
+SITE_HOSTING_SUFFIXES = {
+    "github.io", "gitlab.io", "wixsite.com", "myshopify.com", "blogspot.com", "wordpress.com", "substack.com",
+    "squarespace.com", "weebly.com", "webflow.io", "netlify.app", "vercel.app", "pages.dev", "herokuapp.com",
+    "godaddysites.com", "notion.site", "carrd.co", "tumblr.com", "wixstudio.io", "business.site",
+}
+# Blogs, social networks and shared site builders where the host says nothing about which company a page is about
+SHARED_PLATFORM_DOMAINS = {
+    "medium.com", "sites.google.com", "google.com", "youtube.com", "facebook.com", "instagram.com",
+    "twitter.com", "x.com", "reddit.com", "wikipedia.org", "quora.com", "tiktok.com", "linktr.ee",
+    "wix.com", "github.com", "gitlab.com", "issuu.com", "scribd.com", "slideshare.net", "prnewswire.com",
+    "businesswire.com", "globenewswire.com",
+}
+# Funnel stages whose work a duplicate skips: a scrape always, scoring only if the company
+# would have passed the heuristic filter, a revenue lookup only if it would have scored as relevant
+AVOIDED_WORK_STAGES = {"scrapes": None, "scoring_calls": "heuristic", "revenue_lookups": "scored"}
+def normalize_company_name(name: str) -> str:
+    """
+    Canonical form of a company name for exact matching.
+
+    Lowercases, drops punctuation, a leading "the" and trailing legal suffixes:
+    "The Samsara, Inc." -> "samsara".
+    """
+    tokens = re.findall(r"[a-z0-9]+", name.lower().replace("&", " and "))
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens = tokens[:-1]
+    return " ".join(tokens)
+def company_domain(url: str, directory_domains: Iterable[str] = ()) -> Optional[str]:
+    """
+    Registrable domain of a company website, e.g. "https://www.us.samsara.com/x" -> "samsara.com".
+
+    Sites on hosting platforms keep their own subdomain ("acme.github.io").
+    Returns None for links that don't identify a company: directory sites
+    (linkedin.com, clutch.co, ...), blogs and shared platforms (medium.com,
+    sites.google.com, ...), IP addresses and localhost.
+    """
+    host = (urlparse(url).hostname or "").lower().rstrip(".")
+    if not host or host == "localhost":
+        return None
+    try:
+        ipaddress.ip_address(host)
+        return None
+    except ValueError:
+        pass
+    labels = host.split(".")
+    keep = 3 if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_SUFFIXES else 2
+    if ".".join(labels[-keep:]) in SITE_HOSTING_SUFFIXES:
+        keep += 1
+        if len(labels) < keep:
+            return None
+    domain = ".".join(labels[-keep:])
+    if domain in SHARED_PLATFORM_DOMAINS or any(host == shared or host.endswith("." + shared)
+                                                 for shared in SHARED_PLATFORM_DOMAINS):
+        return None
+    for directory in directory_domains:
+        directory_host = directory.split("/")[0].lower()
+        if domain == directory_host or host.endswith("." + directory_host) or host == directory_host:
+            return None
+    return domain
+def domain_matches_name(normalized_name: str, domain: str) -> bool:
+    """
+    True if a domain plausibly is the company's own site: its first label
+    contains a name token or the whole name ("samsara" -> samsara.com,
+    "motive" -> gomotive.com), or is contained in it.
+
+    Pages about a company on news or review sites are not its website, so
+    their domains must not be used to recognize it.
+    """
+    label = domain.split(".")[0].replace("-", "")
+    compact = normalized_name.replace(" ", "")
+    if len(label) < 3 or not compact:
+        return False
+    tokens = [token for token in normalized_name.split() if len(token) >= 3]
+    return compact in label or label in compact or any(token in label for token in tokens)
+class CompanyIdentityIndex:
+    """
+    Recognizes a company that was already seen under a different name or link.
+
+    A candidate matches an existing entry by normalized name, by website domain
+    (only domains that plausibly are the entry's own site are indexed),
+    or by name-embedding cosine similarity above a threshold (for variants such as
+    "Samsara" vs "Samsara Networks"). Entries for qualified companies are persisted
+    to disk (JSON entries + NumPy embedding matrix); companies only seen during a
+    run are kept in memory so they aren't processed twice in that run.
+    """
+    def __init__(self, path: Path, embeddings=None, similarity_threshold: float = 0.92,
+                 directory_domains: Iterable[str] = ()):
+        self.path = Path(path)
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.directory_domains = list(directory_domains)
+        self._lock = threading.Lock()
+        self.entries: List[Dict] = []
+        self.vectors: Optional[np.ndarray] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._by_name: Dict[str, int] = {}
+        self._by_domain: Dict[str, int] = {}
+        self.load()
+    @property
+    def _entries_file(self) -> Path:
+        return self.path.with_suffix(".json")
+    @property
+    def _vectors_file(self) -> Path:
+        return self.path.with_suffix(".npy")
+    def load(self):
+        """Load persisted entries and their embeddings, if any."""
+        self.entries, self.vectors, self._matrix = [], None, None
+        self._by_name, self._by_domain = {}, {}
+        try:
+            with open(self._entries_file, "r") as f:
+                entries = json.load(f)
+            vectors = np.load(self._vectors_file) if self._vectors_file.exists() else None
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, OSError):
+            return
+        if vectors is not None and len(vectors) != len(entries):
+            print("⚠️ Company index embeddings out of sync with entries. Ignoring stored embeddings.")
+            vectors = None
+        for i, entry in enumerate(entries):
+            vector = vectors[i] if vectors is not None and np.any(vectors[i]) else None
+            self._insert(entry, vector)
+    def save(self):
+        """Persist qualified-company entries (transient run entries are not saved)."""
+        with self._lock:
+            keep = [i for i, entry in enumerate(self.entries) if entry.get("persist")]
+            entries = [self.entries[i] for i in keep]
+            vectors = self.vectors[keep] if self.vectors is not None else None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_entries = self._entries_file.with_suffix(".json.tmp")
+        with open(tmp_entries, "w") as f:
+            json.dump(entries, f, indent=4)
+        if vectors is not None:
+            tmp_vectors = self._vectors_file.with_suffix(".tmp.npy")
+            np.save(tmp_vectors, vectors)
+            os.replace(tmp_vectors, self._vectors_file)
+        os.replace(tmp_entries, self._entries_file)
+    def reset_transient(self):
+        """Forget companies seen during the previous run that were not qualified."""
+        with self._lock:
+            keep = [i for i, entry in enumerate(self.entries) if entry.get("persist")]
+            entries = [self.entries[i] for i in keep]
+            vectors = self.vectors[keep] if self.vectors is not None else None
+            self.entries, self.vectors, self._matrix = [], None, None
+            self._by_name, self._by_domain = {}, {}
+            for i, entry in enumerate(entries):
+                vector = vectors[i] if vectors is not None and np.any(vectors[i]) else None
+                self._insert(entry, vector)
+    def _embed(self, names: List[str]) -> List[Optional[np.ndarray]]:
+        """Unit-length name embeddings (None where embedding is disabled or fails)."""
+        if not self.embeddings or not names:
+            return [None] * len(names)
+        try:
+            vectors = np.asarray(self.embeddings.embed_documents(names), dtype=np.float32)
+        except Exception as e:
+            print(f" ⚠️ Could not embed company names: {e}")
+            return [None] * len(names)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        return list(vectors)
+    def _insert(self, entry: Dict, vector: Optional[np.ndarray]):
+        """Append an entry (caller holds the lock or owns the index)."""
+        index = len(self.entries)
+        self.entries.append(entry)
+        if vector is not None or self.vectors is not None:
+            if self.vectors is None:
+                self._matrix = np.zeros((max(64, 2 * index), len(vector)), dtype=np.float32)
+            elif index >= len(self._matrix):
+                # Grow geometrically so inserts stay amortized O(1)
+                grown = np.zeros((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.float32)
+                grown[:index] = self._matrix[:index]
+                self._matrix = grown
+            if vector is not None and len(vector) == self._matrix.shape[1]:
+                self._matrix[index] = vector
+            self.vectors = self._matrix[:index + 1]
+        self._by_name.setdefault(entry["normalized"], index)
+        if entry.get("domain") and domain_matches_name(entry["normalized"], entry["domain"]):
+            self._by_domain.setdefault(entry["domain"], index)
+    def _find(self, normalized: str, domain: Optional[str], vector: Optional[np.ndarray]) -> Optional[tuple]:
+        """Return (entry index, match type) of the best match (caller holds the lock)."""
+        if normalized in self._by_name:
+            return self._by_name[normalized], "name"
+        if domain and domain in self._by_domain:
+            return self._by_domain[domain], "domain"
+        if vector is None or self.vectors is None or not len(self.entries) or len(vector) != self.vectors.shape[1]:
+            return None
+        similarities = self.vectors @ vector
+        tokens = set(normalized.split())
+        # Best candidates first; one name must extend the other ("samsara" / "samsara networks"),
+        # so near-identical embeddings of "Acme 1 Systems" and "Acme 2 Systems" don't merge
+        for index in np.argsort(-similarities)[:5]:
+            if similarities[index] < self.similarity_threshold:
+                break
+            other_tokens = set(self.entries[index]["normalized"].split())
+            if tokens <= other_tokens or other_tokens <= tokens:
+                return int(index), "embedding"
+        return None
+    def add_known(self, companies: List[Dict]):
+        """Index companies from the results file that aren't indexed yet (embedded in one batch)."""
+        with self._lock:
+            missing = [company for company in companies
+                       if company.get("name") and normalize_company_name(company["name"]) not in self._by_name]
+        if not missing:
+            return
+        vectors = self._embed([company["name"] for company in missing])
+        with self._lock:
+            for company, vector in zip(missing, vectors):
+                normalized = normalize_company_name(company["name"])
+                if normalized in self._by_name:
+                    continue
+                self._insert({"name": company["name"], "normalized": normalized,
+                              "domain": company_domain(company.get("website", ""), self.directory_domains),
+                              "persist": True}, vector)
+    def match_or_add(self, company_name: str, url: str = "") -> Optional[Dict]:
+        """
+        Look up a company; if it is new, claim it so concurrent lookups match it.
+
+        Args:
+            company_name: Verified company name from the LLM
+            url: Link the company was found at
+
+        Returns:
+            Dict with the matched 'name' and 'match' type ('name', 'domain' or 'embedding'),
+            or None if the company is new
+        """
+        normalized = normalize_company_name(company_name)
+        domain = company_domain(url, self.directory_domains)
+        with self._lock:
+            found = self._find(normalized, domain, None)
+        vector = None
+        if found is None:
+            vector = self._embed([company_name])[0]
+        with self._lock:
+            found = found or self._find(normalized, domain, vector)
+            if found is None:
+                self._insert({"name": company_name, "normalized": normalized, "domain": domain,
+                              "persist": False}, vector)
+                return None
+            index, match_type = found
+            matched_name = self.entries[index]["name"]
+        METRICS.increment("icp_dedup_matches_total", match=match_type)
+        return {"name": matched_name, "match": match_type}
+    def release(self, company_name: str):
+        """
+        Drop a company claimed by match_or_add() that couldn't be processed (e.g. its
+        page returned no text), so a later sighting, such as its own website, is processed.
+        Persistent entries are kept.
+        """
+        normalized = normalize_company_name(company_name)
+        with self._lock:
+            index = self._by_name.get(normalized)
+            if index is None or self.entries[index].get("persist"):
+                return
+            del self._by_name[normalized]
+            domain = self.entries[index].get("domain")
+            if domain and self._by_domain.get(domain) == index:
+                del self._by_domain[domain]
+            if self.vectors is not None:
+                # A zero vector never reaches the similarity threshold
+                self.vectors[index] = 0
+            self.entries[index]["released"] = True
+    def mark_persistent(self, company_name: str, url: str = ""):
+        """Keep a company (typically a newly qualified one) in the index across runs."""
+        with self._lock:
+            index = self._by_name.get(normalize_company_name(company_name))
+            if index is not None:
+                self.entries[index]["persist"] = True
+                domain = company_domain(url, self.directory_domains)
+                if domain and not self.entries[index].get("domain"):
+                    self.entries[index]["domain"] = domain
+                    if domain_matches_name(self.entries[index]["normalized"], domain):
+                        self._by_domain.setdefault(domain, index)
+    @staticmethod
+    def avoided_work_report() -> Dict:
+        """
+        Matches by type and an estimate of the downstream work they avoided in this process.
+
+        Every match saves a scrape. Scoring calls and revenue lookups are estimated
+        from the observed funnel: a duplicate would have passed the heuristic filter
+        (and scored as relevant) at the same rate as the verified companies processed.
+        """
+        matches = {match: METRICS.counter_value("icp_dedup_matches_total", match=match)
+                   for match in ("name", "domain", "embedding")}
+        total = sum(matches.values())
+        verified = METRICS.counter_value("icp_funnel_total", stage="verified")
+        rates = {work: 1.0 if stage is None else
+                 (METRICS.counter_value("icp_funnel_total", stage=stage) / verified if verified else 0.0)
+                 for work, stage in AVOIDED_WORK_STAGES.items()}
+        return {
+            "matches": matches,
+            "pass_rates": {work: round(rate, 4) for work, rate in rates.items()},
+            "avoided": {work: round(total * rate, 1) for work, rate in rates.items()},
+        }
@@ -38,8 +38,12 @@ except FileNotFoundError as e:
 # Paths
 DASHCAM_DATA_PATH = ROOT_DIR / "Data"
 DASHCAM_VECTOR_DB_PATH = ROOT_DIR / "vector_db" / "dashcam_vectordb"
+DASHCAM_FLAT_INDEX_PATH = ROOT_DIR / "vector_db" / "dashcam_flat"
 METADATA_FILE = ROOT_DIR / "vector_db" / "metadata.json"
+COMPANY_INDEX_PATH = ROOT_DIR / "vector_db" / "company_index"
 RESULTS_FILE = ROOT_DIR / "results.json"
+WORK_QUEUE_FILE = ROOT_DIR / "work_queue.db"
+REPORTS_DIR = ROOT_DIR / "reports"
 # Create necessary directories
 (ROOT_DIR / "vector_db").mkdir(exist_ok=True)
 DASHCAM_DATA_PATH.mkdir(exist_ok=True)
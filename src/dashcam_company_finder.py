@@ -7,7 +7,9 @@ import concurrent.futures
 import itertools
 from src.advanced_dashcam_rag import AdvancedDashcamRAG
 from src.utils import perform_web_search, parse_json_from_llm_response, get_website_text
-from src.config import CONFIG, RESULTS_FILE
+from src.company_index import CompanyIdentityIndex
+from src.config import CONFIG, RESULTS_FILE, REPORTS_DIR, ROOT_DIR, COMPANY_INDEX_PATH
+from src.metrics import METRICS, profiling
 class DashcamCompanyFinder:
     def __init__(self):
         print("🚀 Initializing DashcamCompanyFinder V6...")
@@ -19,6 +21,7 @@ class DashcamCompanyFinder:
         self.scoring_config = CONFIG.get('scoring', {})
         self.revenue_config = CONFIG.get('revenue', {})
         self.processing_config = CONFIG.get('processing', {})
+        self.dedup_config = CONFIG.get('dedup', {})
        
         # Extract commonly used values
         self.discovery_sources = self.discovery_config.get('sources', {})
@@ -29,6 +32,15 @@ class DashcamCompanyFinder:
         self.relevance_threshold = self.scoring_config.get('relevance_threshold', 7)
         self.revenue_threshold = self.revenue_config.get('minimum_threshold_millions', 15)
         self.fallback_enabled = self.revenue_config.get('fallback_enabled', True)
+       
+        # Company identity index: catches "Samsara" / "Samsara Inc." / "Samsara Networks" before scraping
+        directory_domains = [source for sources in self.discovery_sources.values() for source in sources]
+        self.company_index = CompanyIdentityIndex(
+            COMPANY_INDEX_PATH,
+            embeddings=self.rag.embeddings if self.dedup_config.get('use_embeddings', True) else None,
+            similarity_threshold=self.dedup_config.get('similarity_threshold', 0.92),
+            directory_domains=directory_domains + self.financial_sources
+        )
     def _verify_is_company(self, item: dict, retries: int = 2) -> Optional[str]:
         """
         Verify if a search result is a real company.
@@ -56,6 +68,7 @@ class DashcamCompanyFinder:
                     return None # Explicitly not a company
            
             print(f" ⚠️ _verify_is_company failed (Attempt {attempt + 1}/{retries}). Retrying...")
+            METRICS.increment("icp_retries_total", operation="verify_company")
             time.sleep(0.5)
         return None
     def _passes_heuristic_filter(self, website_text: str) -> bool:
@@ -100,6 +113,7 @@ class DashcamCompanyFinder:
             if data and isinstance(data, dict) and "relevance_score" in data:
                 return int(data.get("relevance_score", 0))
             print(f" ⚠️ _score_relevance failed (Attempt {attempt + 1}/{retries}). Retrying...")
+            METRICS.increment("icp_retries_total", operation="score_relevance")
             time.sleep(0.5)
         return 0
     def _get_revenue_from_financial_sites(self, company_name: str) -> Optional[float]:
@@ -183,15 +197,29 @@ class DashcamCompanyFinder:
         link = item.get('link')
         if not link:
             return None
-        company_name = self._verify_is_company(item)
+        with METRICS.timer("icp_stage_seconds", stage="verify"):
+            company_name = self._verify_is_company(item)
         if not company_name or company_name in existing_company_names:
             return None
+        match = self.company_index.match_or_add(company_name, link)
+        if match:
+            print(f" ⏭️ SKIPPED: {company_name} (Same company as '{match['name']}', {match['match']} match).")
+            return None
         print(f" ✓ Verified as company: {company_name}")
+        METRICS.increment("icp_funnel_total", stage="verified")
         website_text = get_website_text(link)
+        if not website_text:
+            # Scrape failed (or the link had no content): let a later sighting of this company try again
+            self.company_index.release(company_name)
+            print(f" ⚠️ SKIPPED: {company_name} (No website text).")
+            return None
        
         if self._passes_heuristic_filter(website_text):
-            relevance_score = self._score_relevance(company_name, website_text)
+            METRICS.increment("icp_funnel_total", stage="heuristic")
+            with METRICS.timer("icp_stage_seconds", stage="score"):
+                relevance_score = self._score_relevance(company_name, website_text)
             if relevance_score >= self.relevance_threshold:
+                METRICS.increment("icp_funnel_total", stage="scored")
                 print(f" 🎯 RELEVANT (Score: {relevance_score}/10). Adding to list for revenue check.")
                 return {"name": company_name, "website": link, "website_text": website_text}
             else:
@@ -211,6 +239,7 @@ class DashcamCompanyFinder:
             Enriched company dict if qualified, None otherwise
         """
         company_name = company["name"]
+        start = time.perf_counter()
        
         # Try premium financial sources first
         estimated_revenue_m = self._get_revenue_from_financial_sites(company_name)
@@ -224,6 +253,7 @@ class DashcamCompanyFinder:
         # Clean up website_text before saving (it's large and no longer needed)
         if "website_text" in company:
             del company["website_text"]
+        METRICS.observe("icp_stage_seconds", time.perf_counter() - start, stage="enrich")
        
         if estimated_revenue_m and estimated_revenue_m >= self.revenue_threshold:
             company["estimated_revenue_in_millions"] = estimated_revenue_m
@@ -232,6 +262,25 @@ class DashcamCompanyFinder:
         else:
             print(f" ⚠️ DISCARDED: {company_name} (Revenue not found or < ${self.revenue_threshold}M).")
             return None
+    def _load_existing_results(self) -> list[dict]:
+        """Load previously qualified companies from the results file."""
+        try:
+            with open(RESULTS_FILE, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+    def _build_profile_queries(self, territory: str, profile: str) -> list[str]:
+        """Build the discovery search queries for one profile in a territory."""
+        discovery_sources = self.discovery_sources.get(territory, self.discovery_sources.get("USA", []))
+        return [f'site:{source} "{profile} {keyword}"'
+                for keyword in self.positive_keywords
+                for source in discovery_sources]
+    @staticmethod
+    def _print_progress(progress: Dict[str, Dict[str, int]]):
+        """Print one progress line per territory."""
+        for territory, counts in progress.items():
+            print(f" 📈 {territory}: {counts['searches']} searches, {counts['items']} items, "
+                  f"{counts['relevant']} relevant, {counts['qualified']} qualified")
     def find_companies(self, territory: str, limit: int | None = None) -> list[dict]:
         """
         Find and qualify companies in the specified territory.
@@ -243,106 +292,214 @@ class DashcamCompanyFinder:
         Returns:
             List of qualified company dictionaries
         """
-        # Load existing results
-        try:
-            with open(RESULTS_FILE, 'r') as f:
-                all_found_companies = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            all_found_companies = []
+        return self.find_companies_batch([territory], limit=limit)[territory]
+    def find_companies_batch(self, territories: List[str], limit: int | None = None) -> Dict[str, list[dict]]:
+        """
+        Find and qualify companies in several territories within one run.
+       
+        All territories share this finder's LLMs, vector database and worker
+        pools. Work is interleaved round-robin across territories so each one
+        gets a fair share of the workers, and companies, search queries and
+        links are deduplicated across territories.
        
+        Args:
+            territories: Geographic territories (e.g., ["USA", "Europe"])
+            limit: Maximum number of new companies to find per territory (None for unlimited)
+           
+        Returns:
+            Dict mapping each territory to its list of qualified company dictionaries
+        """
+        territories = list(dict.fromkeys(territories))
+        all_found_companies = self._load_existing_results()
         existing_company_names = {comp.get('name') for comp in all_found_companies}
         print(f"📊 Loaded {len(existing_company_names)} previously found companies.")
+        self.company_index.reset_transient()
+        self.company_index.add_known(all_found_companies)
         # --- STAGE 1: DISCOVERY & RELEVANCE SCORING (Profile-by-Profile Batches) ---
         print("\n--- STAGE 1: DISCOVERY & RELEVANCE SCORING ---")
-        company_profiles = self.rag.get_target_company_profiles(territory)
-        discovery_sources = self.discovery_sources.get(territory, self.discovery_sources.get("USA", []))
-        all_relevant_companies = []
+        with METRICS.timer("icp_stage_seconds", stage="profiles"):
+            profiles_by_territory = {territory: self.rag.get_target_company_profiles(territory)
+                                     for territory in territories}
+        progress = {territory: {"searches": 0, "items": 0, "relevant": 0, "qualified": 0}
+                    for territory in territories}
+        relevant_by_territory: Dict[str, list[dict]] = {territory: [] for territory in territories}
         processed_in_run = set()
-        for profile in company_profiles:
-            print(f"\n--- Processing Profile Batch: '{profile}' ---")
-            profile_queries = [f'site:{source} "{profile} {keyword}"'
-                               for keyword in self.positive_keywords
-                               for source in discovery_sources]
-            print(f" 🔎 Performing {len(profile_queries)} web searches in parallel...")
-            search_items = []
+        seen_queries = set()
+        seen_links = set()
+        # Each round takes the next profile of every territory, so territories advance together
+        num_rounds = max((len(profiles) for profiles in profiles_by_territory.values()), default=0)
+        for round_index in range(num_rounds):
+            queries_by_territory = {}
+            for territory in territories:
+                profiles = profiles_by_territory[territory]
+                if round_index >= len(profiles):
+                    continue
+                profile = profiles[round_index]
+                print(f"\n--- Processing Profile Batch: '{profile}' ({territory}) ---")
+                queries = []
+                for query in self._build_profile_queries(territory, profile):
+                    if query not in seen_queries:
+                        seen_queries.add(query)
+                        queries.append((territory, query))
+                queries_by_territory[territory] = queries
+                progress[territory]["searches"] += len(queries)
+            tagged_queries = _round_robin(queries_by_territory.values())
+            print(f" 🔎 Performing {len(tagged_queries)} web searches in parallel...")
+            items_by_territory: Dict[str, list[dict]] = {territory: [] for territory in queries_by_territory}
            
             max_search_workers = self.processing_config.get('max_parallel_searches', 15)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_search_workers) as executor:
-                future_to_query = {executor.submit(perform_web_search, query, 2): query for query in profile_queries}
+            with METRICS.timer("icp_stage_seconds", stage="discovery_search"), \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=max_search_workers) as executor:
+                future_to_query = {executor.submit(perform_web_search, query, 2): (territory, query)
+                                   for territory, query in tagged_queries}
                 for future in concurrent.futures.as_completed(future_to_query):
+                    territory, _ = future_to_query[future]
                     try:
                         results = future.result()
-                        if results:
-                            search_items.extend(results)
+                        for item in results or []:
+                            link = item.get('link')
+                            if link in seen_links:
+                                continue
+                            if link:
+                                seen_links.add(link)
+                            items_by_territory[territory].append(item)
                     except Exception as exc:
                         print(f' ⚠️ A search query generated an exception: {exc}')
-            print(f" 📝 Found {len(search_items)} potential items. Processing in parallel...")
+            for territory, items in items_by_territory.items():
+                progress[territory]["items"] += len(items)
+                METRICS.increment("icp_funnel_total", len(items), stage="searched")
+            tagged_items = _round_robin(
+                [(territory, item) for item in items] for territory, items in items_by_territory.items()
+            )
+            print(f" 📝 Found {len(tagged_items)} potential items. Processing in parallel...")
            
             names_to_skip = existing_company_names | processed_in_run
            
             max_process_workers = self.processing_config.get('max_parallel_processing', 10)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_process_workers) as executor:
-                future_to_item = {executor.submit(self._process_search_item, item, names_to_skip): item for item in search_items}
+            with METRICS.timer("icp_stage_seconds", stage="discovery_processing"), \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=max_process_workers) as executor:
+                future_to_item = {executor.submit(self._process_search_item, item, names_to_skip): (territory, item)
+                                  for territory, item in tagged_items}
                 for future in concurrent.futures.as_completed(future_to_item):
+                    territory, _ = future_to_item[future]
                     try:
                         result = future.result()
                         if result:
-                            if result['name'] not in names_to_skip:
-                                all_relevant_companies.append(result)
+                            if result['name'] not in names_to_skip and result['name'] not in processed_in_run:
+                                relevant_by_territory[territory].append(result)
                                 processed_in_run.add(result['name'])
+                                progress[territory]["relevant"] += 1
                     except Exception as exc:
                         print(f' ⚠️ An item processing generated an exception: {exc}')
+            self._print_progress(progress)
         # --- STAGE 2: REVENUE ENRICHMENT (Parallelized) ---
-        print(f"\n--- STAGE 2: REVENUE ENRICHMENT for {len(all_relevant_companies)} relevant companies ---")
-        qualified_companies = []
+        total_relevant = sum(len(companies) for companies in relevant_by_territory.values())
+        print(f"\n--- STAGE 2: REVENUE ENRICHMENT for {total_relevant} relevant companies ---")
+        qualified_by_territory: Dict[str, list[dict]] = {territory: [] for territory in territories}
        
-        if not all_relevant_companies:
+        if not total_relevant:
             print("No new relevant companies found to enrich.")
         else:
+            tagged_companies = _round_robin(
+                [(territory, company) for company in companies]
+                for territory, companies in relevant_by_territory.items()
+            )
+            open_territories = {territory for territory, companies in relevant_by_territory.items() if companies}
             max_enrich_workers = self.processing_config.get('max_parallel_enrichment', 10)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_enrich_workers) as executor:
-                future_to_company = {executor.submit(self._enrich_company, company): company for company in all_relevant_companies}
+            with METRICS.timer("icp_stage_seconds", stage="enrichment"), \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=max_enrich_workers) as executor:
+                future_to_company = {executor.submit(self._enrich_company, company): (territory, company)
+                                     for territory, company in tagged_companies}
                 for future in concurrent.futures.as_completed(future_to_company):
-                    if limit is not None and len(qualified_companies) >= limit:
-                        print(f"\n🎯 Reached limit of {limit} new companies. Cancelling remaining tasks.")
-                        # Attempt to cancel remaining futures
-                        for f in future_to_company:
-                            f.cancel()
-                        break
+                    territory, _ = future_to_company[future]
+                    if territory not in open_territories or future.cancelled():
+                        continue
                    
                     try:
                         result = future.result()
                         if result:
-                            qualified_companies.append(result)
+                            qualified_by_territory[territory].append(result)
+                            progress[territory]["qualified"] += 1
+                            METRICS.increment("icp_funnel_total", stage="qualified")
                     except Exception as exc:
                         print(f'⚠️ An enrichment task generated an exception: {exc}')
+                   
+                    if limit is not None and len(qualified_by_territory[territory]) >= limit:
+                        print(f"\n🎯 Reached limit of {limit} new companies for {territory}. Cancelling its remaining tasks.")
+                        open_territories.discard(territory)
+                        # Attempt to cancel this territory's remaining futures
+                        for f, (other_territory, _) in future_to_company.items():
+                            if other_territory == territory:
+                                f.cancel()
+                        if not open_territories:
+                            break
+       
+        if len(territories) > 1:
+            print("\n--- PROGRESS BY TERRITORY ---")
+            self._print_progress(progress)
+       
+        dedup_report = self.company_index.avoided_work_report()
+        if any(dedup_report["matches"].values()):
+            matches = ", ".join(f"{n:g} by {match}" for match, n in dedup_report["matches"].items() if n)
+            avoided = ", ".join(f"{n:g} {work.replace('_', ' ')}" for work, n in dedup_report["avoided"].items())
+            print(f"\n♻️ Duplicate companies caught: {matches}. Avoided an estimated {avoided} "
+                  f"(from this run's funnel pass rates).")
        
         # Save results
+        qualified_companies = [company for companies in qualified_by_territory.values() for company in companies]
         if qualified_companies:
             all_found_companies.extend(qualified_companies)
             with open(RESULTS_FILE, 'w') as f:
                 json.dump(all_found_companies, f, indent=4)
             print(f"\n💾 Saved {len(qualified_companies)} new qualified companies to {RESULTS_FILE}.")
-        return qualified_companies
+            for company in qualified_companies:
+                self.company_index.mark_persistent(company['name'], company.get('website', ''))
+            self.company_index.save()
+        return qualified_by_territory
+def _round_robin(groups) -> list:
+    """Interleave several lists one element at a time: [a1, b1, a2, b2, ...]."""
+    sentinel = object()
+    interleaved = itertools.chain.from_iterable(itertools.zip_longest(*groups, fillvalue=sentinel))
+    return [entry for entry in interleaved if entry is not sentinel]
 def main():
     parser = argparse.ArgumentParser(description="Find potential dashcam customers.")
-    parser.add_argument("territory", type=str, nargs='?', default="USA",
-                       help="The geographical territory to search in (e.g., 'USA', 'Europe', 'Middle_East').")
+    parser.add_argument("territories", type=str, nargs='*', default=["USA"],
+                       help="One or more geographical territories to search in (e.g., 'USA', 'Europe', 'Middle_East').")
+    parser.add_argument("--all", action="store_true",
+                       help="Search every territory listed under discovery.sources in config.yaml.")
     parser.add_argument("--test-profiles", action="store_true",
                        help="Run the company profile generation test and exit.")
     parser.add_argument("--limit", type=int, default=None,
-                       help="Limit the number of new companies to find.")
+                       help="Limit the number of new companies to find (per territory).")
+    parser.add_argument("--metrics-dir", type=str, default=None,
+                       help="Directory for the JSON run report and Prometheus textfile (default: metrics.report_dir or reports/).")
+    parser.add_argument("--profile", nargs='?', const="cprofile", choices=["cprofile", "py-spy"], default=None,
+                       help="Profile the run with cProfile (default) or py-spy; output goes to the metrics directory.")
     args = parser.parse_args()
+    territories = args.territories
+    if args.all:
+        territories = list(CONFIG.get('discovery', {}).get('sources', {})) or territories
     if args.test_profiles:
         rag = AdvancedDashcamRAG()
         rag.setup_vector_database()
-        profiles = rag.get_target_company_profiles(territory=args.territory)
+        profiles = {territory: rag.get_target_company_profiles(territory=territory) for territory in territories}
         print("\n--- CUSTOMER PROFILE TEST RESULT ---")
-        print(json.dumps(profiles, indent=4))
+        print(json.dumps(profiles[territories[0]] if len(territories) == 1 else profiles, indent=4))
         return
-    finder = DashcamCompanyFinder()
-    companies = finder.find_companies(args.territory, limit=args.limit)
-    print("\n--- FINAL RESULT ---")
-    print(json.dumps(companies, indent=4))
+    report_dir = CONFIG.get('metrics', {}).get('report_dir')
+    metrics_dir = args.metrics_dir or (ROOT_DIR / report_dir if report_dir else REPORTS_DIR)
+    # Export even when the run crashes or is interrupted: long runs are where the report matters most
+    try:
+        with profiling(args.profile, metrics_dir):
+            finder = DashcamCompanyFinder()
+            if len(territories) == 1:
+                companies = finder.find_companies(territories[0], limit=args.limit)
+            else:
+                companies = finder.find_companies_batch(territories, limit=args.limit)
+        print("\n--- FINAL RESULT ---")
+        print(json.dumps(companies, indent=4))
+    finally:
+        report_paths = METRICS.export(metrics_dir, run_name="find_companies")
+        print(f"\n📈 Run report saved to {report_paths['json']} (Prometheus: {report_paths['prometheus']})")
 if __name__ == "__main__":
     main()
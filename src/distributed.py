@@ -0,0 +1,305 @@
+import argparse
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
+from src.company_index import normalize_company_name
+from src.config import CONFIG, RESULTS_FILE, ROOT_DIR, WORK_QUEUE_FILE, REPORTS_DIR
+from src.metrics import METRICS
+from src.work_queue import WorkQueue
+# Pipeline stages in order; each stage's handler enqueues work for the next one
+STAGES = ["profile", "search", "verify", "scrape", "score", "enrich"]
+def open_queue(path: Optional[str] = None) -> WorkQueue:
+    """Open the work queue configured under 'distributed' in config.yaml."""
+    distributed_config = CONFIG.get('distributed', {})
+    queue_path = Path(path or distributed_config.get('queue_path') or WORK_QUEUE_FILE)
+    if not queue_path.is_absolute():
+        queue_path = ROOT_DIR / queue_path
+    return WorkQueue(
+        queue_path,
+        lease_seconds=distributed_config.get('lease_seconds', 300),
+        max_attempts=distributed_config.get('max_attempts', 3),
+        retry_delay=distributed_config.get('retry_delay_seconds', 5)
+    )
+def seed(queue: WorkQueue, territories: List[str]) -> int:
+    """
+    Enqueue the profile generation tasks that start a distributed run.
+
+    Args:
+        queue: Work queue to seed
+        territories: Geographic territories to search
+
+    Returns:
+        Number of new tasks created
+    """
+    try:
+        with open(RESULTS_FILE, 'r') as f:
+            existing_company_names = sorted({comp.get('name') for comp in json.load(f) if comp.get('name')})
+    except (FileNotFoundError, json.JSONDecodeError):
+        existing_company_names = []
+    queue.set_meta("existing_company_names", existing_company_names)
+    created = 0
+    for territory in territories:
+        if queue.enqueue("profile", f"profile:{territory}", {"territory": territory}):
+            created += 1
+    print(f"🌱 Seeded {created} territories ({len(existing_company_names)} known companies will be skipped).")
+    if created < len(territories):
+        print(f" ℹ️ {len(territories) - created} territories are already in this queue (task keys are unique per run). "
+              f"Use 'seed --reset' to start a new run.")
+    return created
+class PipelineWorker:
+    """
+    Pulls work units from the queue and runs them with a local DashcamCompanyFinder.
+
+    Each handler returns (result, follow_ups) where follow_ups are (kind, key, payload)
+    tuples for the next stage. Task keys make follow-ups idempotent, so a task that is
+    retried or processed twice never duplicates downstream work.
+    """
+    def __init__(self, queue: WorkQueue, worker_id: Optional[str] = None, kinds: Optional[List[str]] = None):
+        # Imported here so the coordinator commands don't need the LLM/scraper stack
+        from src.dashcam_company_finder import DashcamCompanyFinder
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = kinds
+        self.finder = DashcamCompanyFinder()
+        self.existing_company_names = set(queue.get_meta("existing_company_names", []))
+        self.handlers = {
+            "profile": self._handle_profile,
+            "search": self._handle_search,
+            "verify": self._handle_verify,
+            "scrape": self._handle_scrape,
+            "score": self._handle_score,
+            "enrich": self._handle_enrich,
+        }
+    def _handle_profile(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        territory = payload["territory"]
+        profiles = self.finder.rag.get_target_company_profiles(territory)
+        if not profiles:
+            raise RuntimeError(f"No customer profiles generated for {territory}")
+        follow_ups = [("search", f"search:{query}", {"territory": territory, "query": query})
+                      for profile in profiles
+                      for query in self.finder._build_profile_queries(territory, profile)]
+        return {"profiles": profiles}, follow_ups
+    def _handle_search(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        from src.dashcam_company_finder import perform_web_search
+        results = perform_web_search(payload["query"], 2)
+        follow_ups = [("verify", f"verify:{item['link']}", {"territory": payload["territory"], "item": item})
+                      for item in results if item.get('link')]
+        METRICS.increment("icp_funnel_total", len(follow_ups), stage="searched")
+        return {"items": len(results)}, follow_ups
+    def _handle_verify(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        item = payload["item"]
+        company_name = self.finder._verify_is_company(item)
+        if not company_name or company_name in self.existing_company_names:
+            return {"company_name": company_name, "skipped": True}, []
+        print(f" ✓ Verified as company: {company_name}")
+        METRICS.increment("icp_funnel_total", stage="verified")
+        follow_ups = [("scrape", f"scrape:{normalize_company_name(company_name)}",
+                       {"territory": payload["territory"], "name": company_name, "website": item["link"]})]
+        return {"company_name": company_name, "skipped": False}, follow_ups
+    def _handle_scrape(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        from src.dashcam_company_finder import get_website_text
+        website_text = get_website_text(payload["website"])
+        # An empty page is a dead or blocked site, not a transient error: skip it like the in-process pipeline
+        if not website_text or not self.finder._passes_heuristic_filter(website_text):
+            print(f" ⚠️ SKIPPED: {payload['name']} (Failed heuristic filter).")
+            return {"passed_heuristic": False}, []
+        METRICS.increment("icp_funnel_total", stage="heuristic")
+        follow_ups = [("score", f"score:{normalize_company_name(payload['name'])}", dict(payload, website_text=website_text))]
+        return {"passed_heuristic": True}, follow_ups
+    def _handle_score(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        company_name = payload["name"]
+        relevance_score = self.finder._score_relevance(company_name, payload["website_text"])
+        if relevance_score < self.finder.relevance_threshold:
+            print(f" ⚠️ SKIPPED: {company_name} (Not relevant, score: {relevance_score}/10).")
+            return {"relevance_score": relevance_score}, []
+        print(f" 🎯 RELEVANT (Score: {relevance_score}/10). Queued for revenue check.")
+        METRICS.increment("icp_funnel_total", stage="scored")
+        return {"relevance_score": relevance_score}, [("enrich", f"enrich:{normalize_company_name(company_name)}", payload)]
+    def _handle_enrich(self, payload: Dict) -> Tuple[Dict, List[tuple]]:
+        company = {"name": payload["name"], "website": payload["website"], "website_text": payload["website_text"]}
+        qualified = self.finder._enrich_company(company)
+        if qualified:
+            METRICS.increment("icp_funnel_total", stage="qualified")
+        return {"territory": payload["territory"], "company": qualified}, []
+    @contextlib.contextmanager
+    def _keep_lease(self, task: Dict, worker_id: str):
+        """Renew the task's lease in the background while its handler runs."""
+        done = threading.Event()
+        def heartbeat():
+            # Renew well before expiry; stop once the lease is lost, the result will be discarded anyway
+            while not done.wait(self.queue.lease_seconds / 3):
+                if not self.queue.extend_lease(task, worker_id):
+                    break
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+    def _run_loop(self, worker_id: str, poll_interval: float, exit_when_drained: bool, stop: threading.Event):
+        self.queue.register_worker(worker_id)
+        while not stop.is_set():
+            task = self.queue.lease(worker_id, self.kinds)
+            if task is None:
+                if exit_when_drained and self.queue.is_drained():
+                    break
+                time.sleep(poll_interval)
+                continue
+            start = time.time()
+            try:
+                with self._keep_lease(task, worker_id), \
+                        METRICS.timer("icp_stage_seconds", stage=f"task_{task['kind']}"):
+                    result, follow_ups = self.handlers[task["kind"]](task["payload"])
+            except Exception as exc:
+                METRICS.increment("icp_task_failures_total", kind=task["kind"])
+                will_retry = self.queue.fail(task, worker_id, str(exc), busy_seconds=time.time() - start)
+                if will_retry is None:
+                    print(f" ⚠️ [{worker_id}] {task['kind']} task {task['id']} failed after its lease expired; "
+                          f"another worker owns it now: {exc}")
+                    continue
+                status = "will retry" if will_retry else "giving up"
+                print(f" ⚠️ [{worker_id}] {task['kind']} task {task['id']} failed "
+                      f"(Attempt {task['attempts']}/{self.queue.max_attempts}, {status}): {exc}")
+                continue
+            if not self.queue.complete(task, worker_id, result, follow_ups, busy_seconds=time.time() - start):
+                print(f" ⚠️ [{worker_id}] Lease on {task['kind']} task {task['id']} expired; result discarded.")
+    def run(self, concurrency: int = 1, poll_interval: float = 2.0, exit_when_drained: bool = False):
+        """
+        Process tasks until interrupted (or until the queue is drained).
+
+        Args:
+            concurrency: Number of tasks processed in parallel, each under its own worker id
+            poll_interval: Seconds to wait when no task is available
+            exit_when_drained: Stop once no task is pending or leased
+        """
+        print(f"👷 Worker {self.worker_id} started with {concurrency} slot(s).")
+        stop = threading.Event()
+        slot_ids = [self.worker_id] if concurrency == 1 else [f"{self.worker_id}/{i}" for i in range(concurrency)]
+        threads = [threading.Thread(target=self._run_loop, args=(slot_id, poll_interval, exit_when_drained, stop),
+                                    daemon=True)
+                   for slot_id in slot_ids]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping worker; leased tasks will be retried after their lease expires.")
+            stop.set()
+def print_status(queue: WorkQueue):
+    """Print per-stage progress and per-worker throughput."""
+    counts = queue.stage_counts()
+    print(f"\n📊 Queue: {queue.path} ({datetime.now().strftime('%H:%M:%S')})")
+    print(f" {'stage':<8} {'pending':>8} {'leased':>8} {'done':>8} {'failed':>8}")
+    for stage in STAGES:
+        stage_counts = counts.get(stage, {})
+        print(f" {stage:<8} {stage_counts.get('pending', 0):>8} {stage_counts.get('leased', 0):>8} "
+              f"{stage_counts.get('done', 0):>8} {stage_counts.get('failed', 0):>8}")
+    qualified = [r for r in queue.results("enrich") if r and r.get("company")]
+    print(f" 🏆 Qualified so far: {len(qualified)}")
+    workers = queue.worker_stats()
+    if workers:
+        print("\n👷 Workers:")
+        now = time.time()
+        for worker in workers:
+            print(f" {worker['worker_id']} ({worker['host']}): {worker['completed']} done, "
+                  f"{worker['failed']} failed, {worker['tasks_per_minute']:.1f} tasks/min, "
+                  f"{worker['utilization']:.0%} busy, last seen {now - worker['last_seen']:.0f}s ago")
+def collect(queue: WorkQueue) -> Dict[str, list[dict]]:
+    """
+    Merge qualified companies from completed enrich tasks into the results file.
+
+    Returns:
+        Dict mapping each territory to its newly saved companies
+    """
+    try:
+        with open(RESULTS_FILE, 'r') as f:
+            all_found_companies = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        all_found_companies = []
+    known_names = {comp.get('name') for comp in all_found_companies}
+    new_by_territory: Dict[str, list[dict]] = {}
+    for result in queue.results("enrich"):
+        company = result.get("company") if result else None
+        if not company or company["name"] in known_names:
+            continue
+        known_names.add(company["name"])
+        new_by_territory.setdefault(result["territory"], []).append(company)
+    new_companies = [company for companies in new_by_territory.values() for company in companies]
+    if new_companies:
+        all_found_companies.extend(new_companies)
+        with open(RESULTS_FILE, 'w') as f:
+            json.dump(all_found_companies, f, indent=4)
+    print(f"💾 Saved {len(new_companies)} new qualified companies to {RESULTS_FILE}.")
+    return new_by_territory
+def main():
+    parser = argparse.ArgumentParser(description="Run the company finder pipeline across several worker processes.")
+    parser.add_argument("--queue", type=str, default=None,
+                       help="Path to the SQLite work queue (default: distributed.queue_path or work_queue.db).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subparsers.add_parser("seed", help="Enqueue territories to search.")
+    seed_parser.add_argument("territories", type=str, nargs='*', default=["USA"],
+                            help="Territories to search (e.g., 'USA', 'Europe', 'Middle_East').")
+    seed_parser.add_argument("--all", action="store_true",
+                            help="Seed every territory listed under discovery.sources in config.yaml.")
+    seed_parser.add_argument("--reset", action="store_true",
+                            help="Clear all tasks and results of the previous run first (run 'collect' before).")
+    worker_parser = subparsers.add_parser("worker", help="Process tasks from the queue.")
+    worker_parser.add_argument("--worker-id", type=str, default=None,
+                              help="Worker identifier shown in status reports (default: host:pid).")
+    worker_parser.add_argument("--concurrency", type=int, default=None,
+                              help="Tasks processed in parallel by this worker.")
+    worker_parser.add_argument("--stages", type=str, nargs='+', choices=STAGES, default=None,
+                              help="Only process these stages (e.g., 'score enrich' on a GPU host).")
+    worker_parser.add_argument("--exit-when-drained", action="store_true",
+                              help="Exit once the queue has no pending or leased tasks.")
+    worker_parser.add_argument("--metrics-dir", type=str, default=None,
+                              help="Directory for this worker's run report (default: metrics.report_dir or reports/).")
+    status_parser = subparsers.add_parser("status", help="Show progress per stage and throughput per worker.")
+    status_parser.add_argument("--watch", type=float, default=None,
+                              help="Refresh every N seconds until interrupted.")
+    subparsers.add_parser("collect", help="Save qualified companies to the results file.")
+    args = parser.parse_args()
+    queue = open_queue(args.queue)
+    distributed_config = CONFIG.get('distributed', {})
+    if args.command == "seed":
+        territories = args.territories
+        if args.all:
+            territories = list(CONFIG.get('discovery', {}).get('sources', {})) or territories
+        if args.reset:
+            queue.reset()
+            print(f"🧹 Cleared the previous run from {queue.path}.")
+        seed(queue, territories)
+    elif args.command == "worker":
+        worker = PipelineWorker(queue, worker_id=args.worker_id, kinds=args.stages)
+        worker.run(
+            concurrency=args.concurrency or distributed_config.get('worker_concurrency', 4),
+            poll_interval=distributed_config.get('poll_interval_seconds', 2),
+            exit_when_drained=args.exit_when_drained
+        )
+        report_dir = CONFIG.get('metrics', {}).get('report_dir')
+        metrics_dir = args.metrics_dir or (ROOT_DIR / report_dir if report_dir else REPORTS_DIR)
+        run_name = "worker_" + "".join(c if c.isalnum() else "_" for c in worker.worker_id)
+        report_paths = METRICS.export(metrics_dir, run_name=run_name, labels={"worker": worker.worker_id})
+        print(f"📈 Worker report saved to {report_paths['json']} (Prometheus: {report_paths['prometheus']})")
+    elif args.command == "status":
+        try:
+            while True:
+                print_status(queue)
+                if not args.watch:
+                    break
+                time.sleep(args.watch)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "collect":
+        collect(queue)
+if __name__ == "__main__":
+    main()
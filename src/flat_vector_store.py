@@ -0,0 +1,149 @@
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, List, Tuple, Iterable, Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores along the last axis, best first.
+
+    Uses argpartition, so selecting k of n is O(n) instead of a full sort.
+    Works on a single score vector (n,) or a batch (q, n).
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+class FlatVectorStore(VectorStore):
+    """
+    Exact cosine-similarity vector store backed by a flat float32 matrix.
+
+    Embeddings are normalized once at insert time, so a query is a single
+    matrix-vector product followed by a top-k selection. When persisted, the
+    matrix is written as a .npy file and memory-mapped on load (no parsing and
+    no client startup), with chunk texts and metadata in a JSON sidecar.
+    Suited to small corpora such as the brochure knowledge base, where exact
+    search over every chunk is faster than maintaining an ANN index.
+    """
+    VECTORS_FILE = "vectors.npy"
+    CHUNKS_FILE = "chunks.json"
+    def __init__(self, embedding: Embeddings, persist_directory: Optional[str] = None):
+        self._embedding = embedding
+        self.persist_directory = Path(persist_directory) if persist_directory else None
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        if self.persist_directory and (self.persist_directory / self.CHUNKS_FILE).exists():
+            self._load()
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+    def __len__(self) -> int:
+        return len(self._ids)
+    def _load(self):
+        """Memory-map the persisted matrix and read the chunk sidecar."""
+        with open(self.persist_directory / self.CHUNKS_FILE, "r") as f:
+            chunks = json.load(f)
+        vectors = np.load(self.persist_directory / self.VECTORS_FILE, mmap_mode="r")
+        if len(vectors) != len(chunks["ids"]):
+            raise ValueError(f"Vector store at {self.persist_directory} is corrupt: "
+                             f"{len(vectors)} vectors for {len(chunks['ids'])} chunks.")
+        self._vectors = vectors
+        self._ids = chunks["ids"]
+        self._texts = chunks["texts"]
+        self._metadatas = chunks["metadatas"]
+    def persist(self):
+        """Write the matrix and sidecar, replacing any previous files atomically."""
+        if not self.persist_directory:
+            return
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        vectors_path = self.persist_directory / self.VECTORS_FILE
+        chunks_path = self.persist_directory / self.CHUNKS_FILE
+        tmp_vectors = vectors_path.with_suffix(".tmp.npy")
+        matrix = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=self._vectors.shape)
+        matrix[:] = self._vectors
+        matrix.flush()
+        del matrix
+        tmp_chunks = chunks_path.with_suffix(".json.tmp")
+        with open(tmp_chunks, "w") as f:
+            json.dump({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}, f)
+        os.replace(tmp_vectors, vectors_path)
+        os.replace(tmp_chunks, chunks_path)
+        # Continue on the memory-mapped copy instead of holding the matrix twice
+        self._vectors = np.load(vectors_path, mmap_mode="r")
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        self._vectors = vectors if not len(self._ids) else np.vstack([self._vectors, vectors])
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self.persist()
+        return ids
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory: Optional[str] = None,
+                   **kwargs: Any) -> "FlatVectorStore":
+        """Build a new store (replacing any store persisted at persist_directory)."""
+        store = cls(embedding, persist_directory=None)
+        store.persist_directory = Path(persist_directory) if persist_directory else None
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        # Always embed_query: models may embed queries and documents differently, and a batch
+        # must return exactly what the same queries return one at a time
+        vectors = np.asarray([self._embedding.embed_query(query) for query in queries], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+    def _results(self, scores: np.ndarray, indices: np.ndarray) -> List[Tuple[Document, float]]:
+        return [(Document(id=self._ids[i], page_content=self._texts[i], metadata=self._metadatas[i]),
+                 float(scores[i]))
+                for i in indices]
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """Top-k chunks for a query vector with their cosine similarity."""
+        if not len(self._ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._vectors @ query
+        return self._results(scores, top_k_indices(scores, k))
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_batch_with_score([query], k)[0]
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+    def similarity_search_batch_with_score(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """
+        Top-k chunks for several queries at once.
+
+        Each query is embedded with embed_query (as in similarity_search), then all
+        are scored with a single matrix-matrix product, which is much cheaper
+        than one search per query.
+        """
+        if not queries:
+            return []
+        if not len(self._ids):
+            return [[] for _ in queries]
+        scores = self._embed_queries(queries) @ self._vectors.T
+        indices = top_k_indices(scores, k)
+        return [self._results(scores[row], indices[row]) for row in range(len(queries))]
+    def similarity_search_batch(self, queries: List[str], k: int = 4) -> List[List[Document]]:
+        return [[doc for doc, _ in results] for results in self.similarity_search_batch_with_score(queries, k)]
+    def _select_relevance_score_fn(self):
+        # Map cosine similarity [-1, 1] to a relevance score in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
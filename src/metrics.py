@@ -0,0 +1,265 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Order of the qualification funnel in reports
+FUNNEL_STAGES = ["searched", "verified", "heuristic", "scored", "qualified"]
+class MetricsRegistry:
+    """
+    Thread-safe in-process registry of counters and latency histograms.
+
+    Metrics are keyed by name and labels, mirroring the Prometheus data model,
+    and can be exported as a JSON run report or a Prometheus textfile.
+    """
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+    def reset(self):
+        """Clear all metrics and restart the run clock."""
+        with self._lock:
+            self._counters: Dict[tuple, float] = {}
+            self._histograms: Dict[tuple, Dict] = {}
+            self.started_at = time.time()
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+    def increment(self, name: str, amount: float = 1, **labels):
+        """Add to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {"bucket_counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "max": 0.0}
+                self._histograms[key] = histogram
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    histogram["bucket_counts"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+            histogram["max"] = max(histogram["max"], value)
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time the enclosed block and record it in a histogram (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    def record_llm_call(self, model: str, latency: float, prompt_chars: int, response_chars: int, success: bool = True):
+        """Record one LLM call with its latency and prompt/response sizes."""
+        self.increment("icp_llm_calls_total", model=model, status="ok" if success else "error")
+        self.observe("icp_llm_call_seconds", latency, model=model)
+        self.increment("icp_llm_prompt_chars_total", prompt_chars, model=model)
+        self.increment("icp_llm_response_chars_total", response_chars, model=model)
+    def counter_value(self, name: str, **labels) -> float:
+        """Current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+    def _quantile(self, histogram: Dict, q: float) -> Optional[float]:
+        """Estimate a quantile from histogram buckets (upper bound of the bucket holding it)."""
+        if not histogram["count"]:
+            return None
+        target = q * histogram["count"]
+        seen = 0
+        for upper, count in zip(self.buckets, histogram["bucket_counts"]):
+            seen += count
+            if seen >= target:
+                return min(upper, histogram["max"])
+        return histogram["max"]
+    def snapshot(self) -> Dict:
+        """Return all metrics as plain, JSON-serializable data."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms.append({
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram["count"],
+                    "sum": round(histogram["sum"], 6),
+                    "mean": round(histogram["sum"] / histogram["count"], 6),
+                    "max": round(histogram["max"], 6),
+                    "p50": self._quantile(histogram, 0.5),
+                    "p95": self._quantile(histogram, 0.95),
+                    "buckets": dict(zip([str(b) for b in self.buckets], histogram["bucket_counts"])),
+                })
+            return {"counters": counters, "histograms": histograms}
+    def run_report(self) -> Dict:
+        """Build the JSON run report: summary sections plus the raw metrics."""
+        snapshot = self.snapshot()
+        def histograms_named(name):
+            return [h for h in snapshot["histograms"] if h["name"] == name]
+        def counters_named(name):
+            return [c for c in snapshot["counters"] if c["name"] == name]
+        llm_calls = {}
+        for histogram in histograms_named("icp_llm_call_seconds"):
+            model = histogram["labels"]["model"]
+            llm_calls[model] = {
+                "calls": histogram["count"],
+                "errors": self.counter_value("icp_llm_calls_total", model=model, status="error"),
+                "total_seconds": histogram["sum"],
+                "mean_seconds": histogram["mean"],
+                "p95_seconds": histogram["p95"],
+                "prompt_chars": self.counter_value("icp_llm_prompt_chars_total", model=model),
+                "response_chars": self.counter_value("icp_llm_response_chars_total", model=model),
+            }
+        funnel = {c["labels"]["stage"]: c["value"] for c in counters_named("icp_funnel_total")}
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "wall_seconds": round(time.time() - self.started_at, 3),
+            "stages": {h["labels"]["stage"]: {"count": h["count"], "total_seconds": h["sum"],
+                                              "mean_seconds": h["mean"], "p95_seconds": h["p95"]}
+                       for h in histograms_named("icp_stage_seconds")},
+            "llm_calls": llm_calls,
+            "funnel": {stage: funnel.get(stage, 0) for stage in FUNNEL_STAGES},
+            "retries": {c["labels"]["operation"]: c["value"] for c in counters_named("icp_retries_total")},
+            "metrics": snapshot,
+        }
+    def to_prometheus(self, const_labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Args:
+            const_labels: Labels added to every series, e.g. {"run": "worker_host_1"}, so textfiles
+                written by several runs into one collector directory don't collide
+        """
+        def fmt_labels(labels: Dict[str, str], extra: Optional[Dict[str, str]] = None) -> str:
+            merged = dict(labels, **(const_labels or {}), **(extra or {}))
+            if not merged:
+                return ""
+            escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                       for k, v in merged.items())
+            return "{" + ",".join(escaped) + "}"
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot["counters"]:
+            if counter["name"] not in typed:
+                lines.append(f"# TYPE {counter['name']} counter")
+                typed.add(counter["name"])
+            lines.append(f"{counter['name']}{fmt_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for upper, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{fmt_labels(histogram['labels'], {'le': upper})} {cumulative}")
+            lines.append(f"{name}_bucket{fmt_labels(histogram['labels'], {'le': '+Inf'})} {histogram['count']}")
+            lines.append(f"{name}_sum{fmt_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{fmt_labels(histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+    def export(self, output_dir: Path, run_name: str = "run", labels: Optional[Dict[str, str]] = None) -> Dict[str, Path]:
+        """
+        Write the JSON run report and the Prometheus textfile.
+
+        Args:
+            output_dir: Directory for the reports (created if missing)
+            run_name: Prefix of the report file names, also added to every Prometheus series as run="..."
+            labels: Further labels for every Prometheus series (e.g. {"worker": worker_id})
+
+        Returns:
+            Dict with the 'json' and 'prometheus' file paths
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        json_path = output_dir / f"{run_name}_report_{timestamp}.json"
+        with open(json_path, "w") as f:
+            json.dump(self.run_report(), f, indent=4)
+        # Stable name, written atomically, so a node_exporter textfile collector can scrape it
+        prom_path = output_dir / f"{run_name}.prom"
+        tmp_path = prom_path.with_suffix(".prom.tmp")
+        tmp_path.write_text(self.to_prometheus(dict(labels or {}, run=run_name)))
+        os.replace(tmp_path, prom_path)
+        return {"json": json_path, "prometheus": prom_path}
+# Process-wide registry used by all instrumented modules
+METRICS = MetricsRegistry()
+@contextmanager
+def profiling(mode: Optional[str], output_dir: Path):
+    """
+    Profile the enclosed block.
+
+    Args:
+        mode: 'cprofile', 'py-spy' (requires py-spy on PATH) or None to disable
+        output_dir: Directory for the profile output
+
+    cProfile covers the calling thread and threads started inside the block
+    (their stats are merged); pool threads started before the block are not profiled.
+    """
+    if not mode:
+        yield
+        return
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if mode == "py-spy":
+        py_spy = shutil.which("py-spy")
+        if not py_spy:
+            print("⚠️ py-spy not found on PATH (pip install py-spy). Continuing without profiling.")
+            yield
+            return
+        output_path = output_dir / f"profile_{timestamp}.svg"
+        recorder = subprocess.Popen([py_spy, "record", "--pid", str(os.getpid()), "--threads",
+                                     "--output", str(output_path)])
+        try:
+            yield
+        finally:
+            # py-spy writes its flame graph when interrupted
+            recorder.send_signal(signal.SIGINT)
+            recorder.wait(timeout=60)
+            print(f"🔥 py-spy flame graph saved to {output_path}")
+        return
+    profiler = cProfile.Profile()
+    profilers = [profiler]
+    profilers_lock = threading.Lock()
+    per_thread = sys.version_info < (3, 12)
+    def start_thread_profiler(*args):
+        # Before 3.12 a profiler only sees its own thread: give each new thread (the
+        # ThreadPoolExecutor workers doing the actual work) a profiler of its own
+        sys.setprofile(None)
+        thread_profiler = cProfile.Profile()
+        with profilers_lock:
+            profilers.append(thread_profiler)
+        thread_profiler.enable()
+    if per_thread:
+        threading.setprofile(start_thread_profiler)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if per_thread:
+            threading.setprofile(None)
+        with profilers_lock:
+            stats = pstats.Stats(*profilers)
+        output_path = output_dir / f"profile_{timestamp}.prof"
+        stats.dump_stats(str(output_path))
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(20)
+        print(summary.getvalue())
+        print(f"🔥 cProfile stats saved to {output_path} (open with snakeviz or pstats)")
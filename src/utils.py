@@ -1,9 +1,11 @@
 import json
 import re
 import asyncio
+import time
 from typing import Union, Optional
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, LXMLWebScrapingStrategy
 from src.config import CONFIG
+from src.metrics import METRICS
 def perform_web_search(query: str, num_results: int = 5, retries: int = 3) -> list[dict]:
     """
     Performs a web search using the configured provider (DuckDuckGo or Google).
@@ -32,11 +34,13 @@ def perform_web_search(query: str, num_results: int = 5, retries: int = 3) -> li
             print("⚠️ Google API credentials not configured. Falling back to DuckDuckGo.")
             provider = 'ddgs'
         else:
-            return perform_web_search_google(query, api_key, cse_id, num_results, retries)
+            with METRICS.timer("icp_search_seconds", provider=provider):
+                return perform_web_search_google(query, api_key, cse_id, num_results, retries)
    
     # Default to DuckDuckGo
     from src.utils_ddgs import perform_web_search_ddgs
-    return perform_web_search_ddgs(query, num_results, retries)
+    with METRICS.timer("icp_search_seconds", provider=provider):
+        return perform_web_search_ddgs(query, num_results, retries)
 async def scrape_website_with_crawl4ai_async(url: str) -> str:
     """
     Asynchronously scrapes a website using crawl4ai to get the markdown content.
@@ -67,6 +71,14 @@ def get_website_text(url: str) -> str:
     """
     Synchronous wrapper for the async crawl4ai scraper.
     """
+    start = time.perf_counter()
+    text = _run_scraper(url)
+    METRICS.observe("icp_scrape_seconds", time.perf_counter() - start)
+    if not text:
+        METRICS.increment("icp_scrape_failures_total")
+    return text
+def _run_scraper(url: str) -> str:
+    """Run the async scraper from synchronous code, with or without a running event loop."""
     try:
         loop = asyncio.get_running_loop()
         if loop.is_running():
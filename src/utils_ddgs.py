@@ -1,5 +1,6 @@
 import time
 from ddgs import DDGS
+from src.metrics import METRICS
 def perform_web_search_ddgs(query: str, num_results: int = 5, retries: int = 3) -> list[dict]:
     """
     Performs a web search using DuckDuckGo and returns the results, with retry logic.
@@ -29,7 +30,9 @@ def perform_web_search_ddgs(query: str, num_results: int = 5, retries: int = 3)
         except Exception as e:
             print(f"⚠️ DuckDuckGo Search error (Attempt {attempt + 1}/{retries}): {e}")
             if attempt < retries - 1:
+                METRICS.increment("icp_retries_total", operation="ddgs_search")
                 time.sleep(2)
             else:
                 print("❌ Search failed after multiple retries.")
+    METRICS.increment("icp_search_failures_total", provider="ddgs")
     return []
@@ -2,6 +2,7 @@ import os
 import time
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from src.metrics import METRICS
 def perform_web_search_google(query: str, api_key: str, cse_id: str, num_results: int = 5, retries: int = 3) -> list[dict]:
     """
     Performs a web search using Google Custom Search API.
@@ -20,6 +21,7 @@ def perform_web_search_google(query: str, api_key: str, cse_id: str, num_results
    
     if not api_key or not cse_id:
         print("❌ Google API key or CSE ID not provided")
+        METRICS.increment("icp_search_failures_total", provider="google")
         return []
    
     for attempt in range(retries):
@@ -45,12 +47,15 @@ def perform_web_search_google(query: str, api_key: str, cse_id: str, num_results
         except HttpError as e:
             print(f"⚠️ Google API error (Attempt {attempt + 1}/{retries}): {e}")
             if attempt < retries - 1:
+                METRICS.increment("icp_retries_total", operation="google_search")
                 time.sleep(2)
             else:
                 print("❌ Search failed after multiple retries.")
         except Exception as e:
             print(f"⚠️ Unexpected error (Attempt {attempt + 1}/{retries}): {e}")
             if attempt < retries - 1:
+                METRICS.increment("icp_retries_total", operation="google_search")
                 time.sleep(2)
    
+    METRICS.increment("icp_search_failures_total", provider="google")
     return []
@@ -0,0 +1,330 @@
+import json
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, List, Dict
+class WorkQueue:
+    """
+    Durable, SQLite-backed work queue with leases and retries.
+
+    Tasks are identified by a unique key, so enqueueing the same unit of work
+    twice is a no-op. Workers lease tasks for a limited time; a lease that
+    expires (e.g. the worker crashed) makes the task available again, until it
+    has used max_attempts; long-running tasks keep their lease with
+    extend_lease(). Results are only accepted from the worker currently
+    holding the lease, so a task finished twice is recorded once.
+
+    The queue relies on SQLite's WAL mode, which needs shared memory between
+    processes: all workers must run on the same host as the queue file. WAL
+    does not work on network filesystems (NFS, SMB), even ones with locking.
+    """
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        available_at REAL NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, available_at);
+    CREATE TABLE IF NOT EXISTS workers (
+        worker_id TEXT PRIMARY KEY,
+        host TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        busy_seconds REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    '''
+    def __init__(self, path: Path, lease_seconds: float = 300, max_attempts: int = 3, retry_delay: float = 5):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(self.SCHEMA)
+        finally:
+            conn.close()
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation keeps the queue safe to share across threads and processes
+        # on this host (WAL requires shared memory, so the file must not be on a network filesystem)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, kind: str, key: str, payload: dict, now: float) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO tasks (key, kind, payload, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, json.dumps(payload), now, now, now)
+        )
+        return cursor.rowcount > 0
+    def enqueue(self, kind: str, key: str, payload: dict) -> bool:
+        """
+        Add a task unless a task with the same key already exists.
+
+        Returns:
+            True if a new task was created
+        """
+        conn = self._connect()
+        try:
+            return self._insert(conn, kind, key, payload, time.time())
+        finally:
+            conn.close()
+    def set_meta(self, key: str, value):
+        """Store a JSON-serializable value shared by the coordinator and all workers."""
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        finally:
+            conn.close()
+    def get_meta(self, key: str, default=None):
+        """Read a value stored with set_meta()."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return json.loads(row["value"]) if row else default
+        finally:
+            conn.close()
+    def register_worker(self, worker_id: str):
+        """Record a worker so it shows up in progress reports."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO workers (worker_id, host, started_at, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (worker_id, socket.gethostname(), now, now)
+            )
+        finally:
+            conn.close()
+    def lease(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Lease the oldest available task.
+
+        Tasks whose lease expired after their last allowed attempt (the worker
+        crashed or hung every time) are marked failed instead of leased again.
+
+        Args:
+            worker_id: Identifier of the worker taking the task
+            kinds: Restrict to these task kinds (None for any)
+
+        Returns:
+            Task dict with 'id', 'kind', 'key', 'payload' and 'attempts', or None if nothing is available
+        """
+        now = time.time()
+        kind_filter = ""
+        params: list = [now, now, self.max_attempts]
+        if kinds:
+            kind_filter = f"AND kind IN ({','.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'Lease expired after ' || attempts || ' attempts', "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires <= ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, kind, key, payload, attempts FROM tasks "
+                "WHERE ((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires <= ?)) "
+                f"AND attempts < ? {kind_filter} ORDER BY id LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("UPDATE workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "key": row["key"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1,
+        }
+    def extend_lease(self, task: Dict, worker_id: str) -> bool:
+        """
+        Renew a lease for another lease_seconds while the task is still being processed.
+
+        Returns:
+            True if the caller still holds the lease, False if it was lost
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + self.lease_seconds, now, task["id"], worker_id)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+    def complete(self, task: Dict, worker_id: str, result=None, follow_ups: Optional[List[tuple]] = None,
+                 busy_seconds: float = 0.0) -> bool:
+        """
+        Record a task's result and enqueue its follow-up tasks atomically.
+
+        Args:
+            task: Task dict returned by lease()
+            worker_id: Worker that processed the task
+            result: JSON-serializable result
+            follow_ups: List of (kind, key, payload) tuples to enqueue
+            busy_seconds: Time the worker spent on the task
+
+        Returns:
+            True if the result was recorded, False if the lease was lost (result ignored)
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_owner = ?, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), worker_id, now, task["id"], worker_id)
+            )
+            recorded = cursor.rowcount > 0
+            if recorded:
+                for kind, key, payload in follow_ups or []:
+                    self._insert(conn, kind, key, payload, now)
+                conn.execute(
+                    "UPDATE workers SET completed = completed + 1, busy_seconds = busy_seconds + ?, "
+                    "last_seen = ? WHERE worker_id = ?",
+                    (busy_seconds, now, worker_id)
+                )
+            conn.execute("COMMIT")
+            return recorded
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    def fail(self, task: Dict, worker_id: str, error: str, busy_seconds: float = 0.0) -> Optional[bool]:
+        """
+        Release a task after an error, scheduling a retry or marking it failed.
+
+        Returns:
+            True if the task will be retried, False if it is marked failed,
+            None if the lease was lost (another worker owns the task; nothing recorded)
+        """
+        now = time.time()
+        will_retry = task["attempts"] < self.max_attempts
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "available_at = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                ('pending' if will_retry else 'failed', error, now + self.retry_delay * task["attempts"],
+                 now, task["id"], worker_id)
+            )
+            if cursor.rowcount == 0:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE workers SET failed = failed + 1, busy_seconds = busy_seconds + ?, "
+                "last_seen = ? WHERE worker_id = ?",
+                (busy_seconds, now, worker_id)
+            )
+            conn.execute("COMMIT")
+            return will_retry
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    def reset(self):
+        """Delete all tasks, workers and shared values, so the queue can be seeded for a new run."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM tasks")
+            conn.execute("DELETE FROM workers")
+            conn.execute("DELETE FROM meta")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    def is_drained(self) -> bool:
+        """True if no task is pending or leased."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')").fetchone()
+            return row[0] == 0
+        finally:
+            conn.close()
+    def stage_counts(self) -> Dict[str, Dict[str, int]]:
+        """Task counts per kind and status, e.g. {'score': {'done': 12, 'pending': 3}}."""
+        conn = self._connect()
+        try:
+            counts: Dict[str, Dict[str, int]] = {}
+            for row in conn.execute("SELECT kind, status, COUNT(*) AS n FROM tasks GROUP BY kind, status"):
+                counts.setdefault(row["kind"], {})[row["status"]] = row["n"]
+            return counts
+        finally:
+            conn.close()
+    def worker_stats(self) -> List[Dict]:
+        """Per-worker completion counts and throughput."""
+        conn = self._connect()
+        try:
+            stats = []
+            for row in conn.execute("SELECT * FROM workers ORDER BY worker_id"):
+                elapsed = max(row["last_seen"] - row["started_at"], 1e-9)
+                stats.append({
+                    "worker_id": row["worker_id"],
+                    "host": row["host"],
+                    "completed": row["completed"],
+                    "failed": row["failed"],
+                    "tasks_per_minute": 60 * row["completed"] / elapsed,
+                    "utilization": min(row["busy_seconds"] / elapsed, 1.0),
+                    "last_seen": row["last_seen"],
+                })
+            return stats
+        finally:
+            conn.close()
+    def results(self, kind: str) -> List[Dict]:
+        """Results of all completed tasks of the given kind."""
+        conn = self._connect()
+        try:
+            return [json.loads(row["result"]) for row in
+                    conn.execute("SELECT result FROM tasks WHERE kind = ? AND status = 'done' ORDER BY id", (kind,))]
+        finally:
+            conn.close()
@@ -0,0 +1,40 @@
+from src.company_index import CompanyIdentityIndex, company_domain, normalize_company_name
+def test_normalize_company_name():
+    assert normalize_company_name("The Samsara, Inc.") == "samsara"
+    assert normalize_company_name("Lytx Holdings LLC") == "lytx"
+def test_company_domain():
+    assert company_domain("https://www.us.samsara.com/x") == "samsara.com"
+    assert company_domain("https://shop.example.co.uk/") == "example.co.uk"
+    assert company_domain("https://acme.github.io/docs") == "acme.github.io"
+    assert company_domain("https://github.io/") is None
+    assert company_domain("https://medium.com/b") is None
+    assert company_domain("https://sites.google.com/view/acme") is None
+    assert company_domain("https://www.linkedin.com/company/acme", ["linkedin.com"]) is None
+    assert company_domain("http://127.0.0.1:8000/acme/") is None
+def test_domain_match_requires_own_site(tmp_path):
+    index = CompanyIdentityIndex(tmp_path / "index")
+    assert index.match_or_add("Motive", "https://gomotive.com/") is None
+    assert index.match_or_add("KeepTruckin", "https://www.gomotive.com/about")["match"] == "domain"
+    # A news article is not the company's website, so its domain identifies nobody
+    assert index.match_or_add("Nauto", "https://techcrunch.com/nauto-raises") is None
+    assert index.match_or_add("Lytx", "https://techcrunch.com/lytx-launches") is None
+    assert index.match_or_add("Samsara", "https://medium.com/b") is None
+    assert index.match_or_add("Samsara Inc.", "https://medium.com/c")["match"] == "name"
+def test_persisted_entries_survive_reload(tmp_path):
+    index = CompanyIdentityIndex(tmp_path / "index")
+    index.match_or_add("Motive", "https://gomotive.com/")
+    index.match_or_add("Transient Co", "https://transient.example/")
+    index.mark_persistent("Motive")
+    index.save()
+    reloaded = CompanyIdentityIndex(tmp_path / "index")
+    assert reloaded.match_or_add("Motive Inc")["name"] == "Motive"
+    assert reloaded.match_or_add("Transient Co") is None
+def test_release_lets_company_be_processed_again(tmp_path):
+    index = CompanyIdentityIndex(tmp_path / "index")
+    assert index.match_or_add("Samsara", "https://samsara.com/blog") is None
+    index.release("Samsara")
+    assert index.match_or_add("Samsara Inc.", "https://www.samsara.com/") is None
+    assert index.match_or_add("Samsara", "https://samsara.com/")["match"] == "name"
+    index.mark_persistent("Samsara")
+    index.release("Samsara")
+    assert index.match_or_add("Samsara")["name"] == "Samsara Inc."
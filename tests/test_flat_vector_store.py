@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.flat_vector_store import FlatVectorStore, top_k_indices
+class WordEmbeddings(Embeddings):
+    """Bag-of-words embeddings over a tiny vocabulary; queries are embedded differently on purpose."""
+    VOCABULARY = ["fleet", "dashcam", "camera", "night", "vision", "insurance", "claims", "bus"]
+    def _embed(self, text):
+        words = text.lower().split()
+        return [float(words.count(word)) for word in self.VOCABULARY]
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+    def embed_query(self, text):
+        return [value + 0.1 for value in self._embed(text)]
+TEXTS = ["fleet dashcam", "school bus camera", "insurance claims", "night vision camera", "fleet insurance"]
+def test_top_k_indices_single_and_batch():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert top_k_indices(scores, 2).tolist() == [1, 3]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k_indices(scores, 0).shape == (0,)
+    batch = np.array([[0.1, 0.9, 0.5], [0.8, 0.2, 0.3]], dtype=np.float32)
+    assert top_k_indices(batch, 2).tolist() == [[1, 2], [0, 2]]
+    assert top_k_indices(batch, 5).tolist() == [[1, 2, 0], [0, 2, 1]]
+def test_persist_and_memory_mapped_reload(tmp_path):
+    store = FlatVectorStore.from_texts(TEXTS, WordEmbeddings(), metadatas=[{"i": i} for i in range(len(TEXTS))],
+                                       persist_directory=str(tmp_path))
+    reloaded = FlatVectorStore(WordEmbeddings(), persist_directory=str(tmp_path))
+    assert isinstance(reloaded._vectors, np.memmap)
+    assert len(reloaded) == len(TEXTS)
+    expected = store.similarity_search_with_score("night camera", k=2)
+    assert reloaded.similarity_search_with_score("night camera", k=2) == expected
+    assert expected[0][0].page_content == "night vision camera" and expected[0][0].metadata == {"i": 3}
+    reloaded.add_texts(["bus dashcam"])
+    assert len(FlatVectorStore(WordEmbeddings(), persist_directory=str(tmp_path))) == len(TEXTS) + 1
+def test_reload_rejects_corrupt_store(tmp_path):
+    FlatVectorStore.from_texts(TEXTS, WordEmbeddings(), persist_directory=str(tmp_path))
+    np.save(tmp_path / FlatVectorStore.VECTORS_FILE, np.zeros((2, 8), dtype=np.float32))
+    with pytest.raises(ValueError):
+        FlatVectorStore(WordEmbeddings(), persist_directory=str(tmp_path))
+def test_batch_search_matches_single_searches():
+    store = FlatVectorStore.from_texts(TEXTS, WordEmbeddings())
+    queries = ["fleet camera", "insurance", "night vision bus"]
+    batch = store.similarity_search_batch_with_score(queries, k=3)
+    single = [store.similarity_search_with_score(query, k=3) for query in queries]
+    assert [[(doc.page_content, round(score, 5)) for doc, score in results] for results in batch] == \
+           [[(doc.page_content, round(score, 5)) for doc, score in results] for results in single]
+def test_empty_store():
+    store = FlatVectorStore(WordEmbeddings())
+    assert store.similarity_search("fleet") == []
+    assert store.similarity_search_batch(["fleet", "bus"]) == [[], []]
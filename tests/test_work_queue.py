@@ -0,0 +1,69 @@
+import time
+import pytest
+from src.work_queue import WorkQueue
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(tmp_path / "queue.db", lease_seconds=0.2, max_attempts=2, retry_delay=0)
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue("search", "search:a", {"query": "a"})
+    assert not queue.enqueue("search", "search:a", {"query": "a"})
+    assert queue.stage_counts() == {"search": {"pending": 1}}
+def test_complete_records_result_and_follow_ups(queue):
+    queue.enqueue("search", "search:a", {"query": "a"})
+    task = queue.lease("w1")
+    assert task["payload"] == {"query": "a"} and task["attempts"] == 1
+    assert queue.lease("w2") is None
+    assert queue.complete(task, "w1", {"items": 1}, [("verify", "verify:x", {"link": "x"})])
+    assert queue.results("search") == [{"items": 1}]
+    assert queue.lease("w1", kinds=["verify"])["key"] == "verify:x"
+def test_complete_rejects_lost_lease(queue):
+    queue.enqueue("search", "search:a", {})
+    task = queue.lease("w1")
+    time.sleep(0.25)
+    retry = queue.lease("w2")
+    assert retry["id"] == task["id"] and retry["attempts"] == 2
+    assert not queue.complete(task, "w1", "stale")
+    assert queue.complete(retry, "w2", "fresh")
+    assert queue.results("search") == ["fresh"]
+def test_expired_lease_on_last_attempt_fails_task(queue):
+    queue.enqueue("search", "search:a", {})
+    queue.lease("w1")
+    time.sleep(0.25)
+    queue.lease("w2")
+    time.sleep(0.25)
+    assert queue.lease("w3") is None
+    assert queue.stage_counts() == {"search": {"failed": 1}}
+    assert queue.is_drained()
+def test_extend_lease_keeps_task(queue):
+    queue.enqueue("search", "search:a", {})
+    task = queue.lease("w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.extend_lease(task, "w1")
+    assert queue.lease("w2") is None
+    assert not queue.extend_lease(task, "w2")
+    assert queue.complete(task, "w1", "ok")
+def test_fail_retries_then_gives_up(queue):
+    queue.enqueue("search", "search:a", {})
+    task = queue.lease("w1")
+    assert queue.fail(task, "w1", "boom")
+    task = queue.lease("w1")
+    assert task["attempts"] == 2
+    assert not queue.fail(task, "w1", "boom")
+    assert queue.lease("w1") is None
+    assert queue.stage_counts() == {"search": {"failed": 1}}
+    assert queue.worker_stats() == []
+def test_fail_after_lost_lease_records_nothing(queue):
+    queue.enqueue("search", "search:a", {})
+    task = queue.lease("w1")
+    time.sleep(0.25)
+    retry = queue.lease("w2")
+    assert queue.fail(task, "w1", "boom") is None
+    assert queue.complete(retry, "w2", "ok")
+def test_reset_allows_reseeding(queue):
+    queue.enqueue("profile", "profile:USA", {})
+    queue.complete(queue.lease("w1"), "w1", "done")
+    assert not queue.enqueue("profile", "profile:USA", {})
+    queue.reset()
+    assert queue.enqueue("profile", "profile:USA", {})
+    assert queue.stage_counts() == {"profile": {"pending": 1}}